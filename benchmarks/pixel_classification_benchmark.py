@@ -1,18 +1,21 @@
 # pyright: strict
 
-from concurrent.futures import Executor, Future, wait as wait_futures
+from concurrent.futures import Executor, Future, as_completed
 from functools import partial
 from pathlib import Path, PurePosixPath
-from typing import Any, List, Sequence
+from typing import Any, Callable, Iterator, List, Sequence, Tuple
 import time
 import argparse
+import itertools
+import os
 import re
 import sys
 
-from ndstructs.point5D import Point5D
+import numpy as np
+from ndstructs.point5D import Interval5D, Point5D, Shape5D
 
 from webilastik.annotations.annotation import Annotation
-from webilastik.classifiers.pixel_classifier import PixelClassifier, VigraPixelClassifier
+from webilastik.classifiers.pixel_classifier import VigraPixelClassifier
 from webilastik.datasource import DataRoi, DataSource
 from webilastik.datasource.skimage_datasource import SkimageDataSource
 from webilastik.features.channelwise_fastfilters import get_axis_2d
@@ -23,8 +26,8 @@ from webilastik.features.ilp_filter import (
     IlpDifferenceOfGaussians,
     IlpStructureTensorEigenvalues,
     IlpHessianOfGaussianEigenvalues,
+    IlpFilter,
 )
-from webilastik.features.feature_extractor import FeatureExtractor, JsonableFeatureExtractor
 from webilastik.datasource.precomputed_chunks_datasource import PrecomputedChunksDataSource
 from webilastik.filesystem.osfs import OsFs
 
@@ -41,7 +44,7 @@ feature_extractors_classes = {
 
 default_scales = [0.7, 1.0, 1.6, 3.5, 5.0, 10.0]
 
-def feature_extractor_from_arg(arg: str) -> FeatureExtractor:
+def feature_extractor_from_arg(arg: str) -> IlpFilter:
     extractor_class_name_regex = r"(?P<extractor_class_name>\w+)"
     open_parens_regex = r"\("
     scale_regex = r"(?P<scale>[0-9]+\.[0-9]+)"
@@ -59,9 +62,78 @@ def feature_extractor_from_arg(arg: str) -> FeatureExtractor:
     return feature_extractors_classes[class_name](ilp_scale=float(scale), axis_2d=axis_2d)
 
 
-def compute_tile(classifier: PixelClassifier[Any], roi: DataRoi):
-    print(f"Predicting on {roi}")
-    _ = classifier(roi)#.as_uint8(normalized=True).show_channels()
+def pick_tile_side(
+    *, dtype: "np.dtype[Any]", num_channels: int, num_features: int, num_spatial_dims: int, l2_bytes: "int | None" = None
+) -> int:
+    """Side of a tile whose input and feature data fit in about half of the L2 cache, rounded to a multiple of 8"""
+    if l2_bytes is None:
+        try:
+            l2_bytes = os.sysconf("SC_LEVEL2_CACHE_SIZE")
+        except (ValueError, OSError):
+            l2_bytes = 0
+        l2_bytes = l2_bytes if l2_bytes > 0 else 1024 * 1024
+    bytes_per_voxel = num_channels * (dtype.itemsize + num_features * np.dtype("float32").itemsize)
+    side = int((l2_bytes / 2 / bytes_per_voxel) ** (1 / num_spatial_dims))
+    return max(8, side // 8 * 8)
+
+def iter_morton_order(grid_shape: Tuple[int, int, int]) -> Iterator[Tuple[int, int, int]]:
+    """All (x, y, z) indices of a grid of the given shape, in Z-order. Indices are decoded from a counter instead of
+    sorting the whole grid, so they can be consumed lazily"""
+    num_bits = [max(side - 1, 0).bit_length() for side in grid_shape]
+    # (axis, bit) of each bit of the counter. Axes stop taking part once all of their bits are used up, so that the
+    # counter never runs far past the end of long and thin grids
+    bit_layout = [(axis, bit) for bit in range(max(num_bits)) for axis in range(3) if bit < num_bits[axis]]
+    for code in range(1 << len(bit_layout)):
+        index = [0, 0, 0]
+        for position, (axis, bit) in enumerate(bit_layout):
+            index[axis] |= ((code >> position) & 1) << bit
+        if all(i < side for i, side in zip(index, grid_shape)):
+            yield (index[0], index[1], index[2])
+
+def get_tiles(datasource: DataSource, tile_shape: Shape5D) -> Iterator[DataRoi]:
+    # Visiting tiles in Z-order keeps spatial neighbors (which share haloed source data) close together
+    # in time, so they are more likely to still be in the datasource's tile cache
+    roi = datasource.roi
+    grid_shape = (
+        -(-roi.shape.x // tile_shape.x),
+        -(-roi.shape.y // tile_shape.y),
+        -(-roi.shape.z // tile_shape.z),
+    )
+    for x, y, z in iter_morton_order(grid_shape):
+        start = roi.start + Point5D.zero(x=x * tile_shape.x, y=y * tile_shape.y, z=z * tile_shape.z)
+        region = roi.updated(
+            x=(start.x, start.x + tile_shape.x),
+            y=(start.y, start.y + tile_shape.y),
+            z=(start.z, start.z + tile_shape.z),
+        ).clamped(datasource.interval)
+        for tile in region.get_tiles(tile_shape=tile_shape, tiles_origin=datasource.location):
+            yield tile.clamped(datasource.interval)
+
+def compute_tiles(classifier: VigraPixelClassifier[Any], rois: Sequence[DataRoi]) -> int:
+    print(f"Predicting on {len(rois)} tiles starting at {rois[0]}")
+    return len(classifier.predict_batch(rois))
+
+# (t, c, x, y, z) spans of a tile. Much cheaper to pickle than a DataRoi, which drags its whole datasource along
+TileSpans = Tuple[Tuple[int, int], Tuple[int, int], Tuple[int, int], Tuple[int, int], Tuple[int, int]]
+
+def to_tile_spans(roi: Interval5D) -> TileSpans:
+    return (roi.t, roi.c, roi.x, roi.y, roi.z)
+
+_worker_classifier: "VigraPixelClassifier[Any] | None" = None
+_worker_datasource: "DataSource | None" = None
+
+def init_worker(pickled_classifier: bytes, pickled_datasource: bytes):
+    import pickle
+    global _worker_classifier, _worker_datasource
+    _worker_classifier = pickle.loads(pickled_classifier)
+    _worker_datasource = pickle.loads(pickled_datasource)
+
+def compute_tiles_on_worker(tiles_spans: Sequence[TileSpans]) -> int:
+    assert _worker_classifier is not None, "Worker process was not initialized with init_worker"
+    assert _worker_datasource is not None, "Worker process was not initialized with init_worker"
+    datasource = _worker_datasource
+    rois = [DataRoi(datasource, t=t, c=c, x=x, y=y, z=z) for (t, c, x, y, z) in tiles_spans]
+    return compute_tiles(_worker_classifier, rois)
 
 if __name__ == "__main__":
 
@@ -85,12 +157,33 @@ if __name__ == "__main__":
     _ = argparser.add_argument(
         "--num-tiles"
     )
+    _ = argparser.add_argument(
+        "--tile-size",
+        help=(
+            "Side length (in pixels) of the tiles to predict on. Defaults to the datasource's own tile shape. "
+            "'auto' picks the largest side, in multiples of 8, for which the raw data and all computed features of "
+            "a tile fit in about half of the L2 cache (see pick_tile_side). This keeps the filter stack from "
+            "streaming each tile through DRAM once per filter"
+        ),
+    )
+    _ = argparser.add_argument(
+        "--process-pool-workers",
+        type=int,
+        help=(
+            "Predict on a process pool with this many workers instead of the executor from executor_getter. "
+            "The classifier is shipped to each worker once, when it starts, instead of with every task"
+        ),
+    )
+    _ = argparser.add_argument(
+        "--tiles-per-task",
+        type=int,
+        default=4,
+        help="Number of tiles whose features are fed to the classifier in a single predict call",
+    )
 
     args = argparser.parse_args()
 
-    executor: Executor = get_executor(hint="server_tile_handler")
-
-    selected_feature_extractors: Sequence[JsonableFeatureExtractor] = args.extractors
+    selected_feature_extractors: Sequence[IlpFilter] = args.extractors
     num_tiles = None if args.num_tiles is None else int(args.num_tiles)
 
     mouse_datasources: List[DataSource] = [
@@ -232,7 +325,7 @@ if __name__ == "__main__":
 
     print(f"Extractors:")
     for fe in selected_feature_extractors:
-        print(fe.to_json_value())
+        print(fe.to_dto().to_json_value())
 
     t = time.time()
     classifier = VigraPixelClassifier.train(
@@ -246,19 +339,58 @@ if __name__ == "__main__":
     print(f"Trained classifier in {time.time() - t} seconds")
     if isinstance(classifier, Exception):
         raise classifier
-    f = partial(compute_tile, classifier)
+    executor: Executor
+    submit_tiles: "Callable[[Sequence[DataRoi]], Future[int]]"
+    if args.process_pool_workers is None:
+        executor = get_executor(hint="server_tile_handler")
+        submit_tiles = partial(executor.submit, compute_tiles, classifier)
+    else:
+        # only imported when shipping the classifier to worker processes
+        from concurrent.futures import ProcessPoolExecutor
+        import pickle
+        executor = ProcessPoolExecutor(
+            max_workers=args.process_pool_workers,
+            initializer=init_worker,
+            initargs=(pickle.dumps(classifier), pickle.dumps(datasource)),
+        )
+        submit_tiles = lambda rois: executor.submit(compute_tiles_on_worker, [to_tile_spans(roi) for roi in rois])
 
     t = time.time()
-    futs: "List[Future[Any]]" = []
+    futs: "List[Future[int]]" = []
+
+    if args.tile_size is None:
+        tile_shape = datasource.tile_shape
+    else:
+        if args.tile_size == "auto":
+            num_spatial_dims = len([extent for extent in datasource.shape.to_tuple("xyz") if extent > 1])
+            tile_side = pick_tile_side(
+                dtype=datasource.dtype,
+                num_channels=datasource.shape.c,
+                num_features=sum(fx.channel_multiplier for fx in selected_feature_extractors),
+                num_spatial_dims=num_spatial_dims,
+            )
+        else:
+            tile_side = int(args.tile_size)
+        tile_shape = Shape5D(
+            x=tile_side if datasource.shape.x > 1 else 1,
+            y=tile_side if datasource.shape.y > 1 else 1,
+            z=tile_side if datasource.shape.z > 1 else 1,
+            c=datasource.shape.c,
+        )
+    print(f"Using tile shape {tile_shape}")
 
-    requested_num_tiles = num_tiles or datasource.roi.get_num_tiles(tile_shape=datasource.tile_shape)
+    requested_num_tiles = num_tiles or datasource.roi.get_num_tiles(tile_shape=tile_shape)
+    tiles = itertools.islice(get_tiles(datasource, tile_shape), requested_num_tiles)
     # for tile in datasource.roi.get_datasource_tiles():
     #     _ = tile.retrieve() #prefetch
-    for tile in datasource.roi.get_datasource_tiles():
-        if len(futs) >= requested_num_tiles:
+    num_predicted_tiles = 0
+    while True:
+        batch = list(itertools.islice(tiles, args.tiles_per_task))
+        if len(batch) == 0:
             break
-        futs.append(executor.submit(f, tile))
+        futs.append(submit_tiles(batch))
         print(".", end="")
-    _ = wait_futures(futs)
+    for fut in as_completed(futs):
+        num_predicted_tiles += fut.result()
     print(f"ARGV: {sys.argv}")
-    print(f"[{executor.__class__.__name__}] Predicted {len(futs)} tiles sized {datasource.tile_shape} in {time.time() - t}s")
+    print(f"[{executor.__class__.__name__}] Predicted {num_predicted_tiles} tiles sized {tile_shape} in {time.time() - t}s")
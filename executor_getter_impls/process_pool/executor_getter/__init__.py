@@ -1,8 +1,29 @@
 from concurrent.futures import Executor, ProcessPoolExecutor
 from typing import Optional
-from webilastik.scheduling import ExecutorGetter, ExecutorHint
+import atexit
+import multiprocessing
+import threading
+
+from webilastik.scheduling import ExecutorGetter, ExecutorHint, SerialExecutor
+
+_lock = threading.Lock()
+_executor: "ProcessPoolExecutor | None" = None
+
+def _shutdown_executor():
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+
+_ = atexit.register(_shutdown_executor)
 
 def _get_process_pool_executor(*, hint: ExecutorHint, max_workers: Optional[int] = None) -> Executor:
-    return ProcessPoolExecutor(max_workers=max_workers)
+    global _executor
+    # worker processes run their share of the work inline instead of spawning pools of their own
+    if multiprocessing.parent_process() is not None:
+        return SerialExecutor()
+    with _lock:
+        if _executor is None:
+            # the pool is shared by every caller, so it's sized to the machine rather than to the first request
+            _executor = ProcessPoolExecutor()
+    return _executor
 
-get_executor: ExecutorGetter = _get_process_pool_executor
\ No newline at end of file
+get_executor: ExecutorGetter = _get_process_pool_executor
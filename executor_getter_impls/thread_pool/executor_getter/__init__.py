@@ -1,8 +1,31 @@
 from concurrent.futures import Executor, ThreadPoolExecutor
 from typing import Optional
-from webilastik.scheduling import ExecutorGetter, ExecutorHint
+import atexit
+import os
+import threading
+
+from webilastik.scheduling import ExecutorGetter, ExecutorHint, SerialExecutor
+
+WORKER_THREAD_PREFIX = "worker_pool_thread_"
+
+_lock = threading.Lock()
+_executor: "ThreadPoolExecutor | None" = None
+
+def _shutdown_executor():
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+
+_ = atexit.register(_shutdown_executor)
 
 def _get_thread_pool_executor(*, hint: ExecutorHint, max_workers: Optional[int] = None) -> Executor:
-    return ThreadPoolExecutor(max_workers=max_workers)
+    global _executor
+    # tasks already running in the pool must not block on the pool itself, or they can starve each other
+    if threading.current_thread().name.startswith(WORKER_THREAD_PREFIX):
+        return SerialExecutor()
+    with _lock:
+        if _executor is None:
+            # the pool is shared by every caller, so it's sized to the machine rather than to the first request
+            _executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix=WORKER_THREAD_PREFIX)
+    return _executor
 
-get_executor: ExecutorGetter = _get_thread_pool_executor
\ No newline at end of file
+get_executor: ExecutorGetter = _get_thread_pool_executor
@@ -62,6 +62,7 @@ export class NeuroglancerViewportDriver implements IViewportDriver{
 class Layer{
     private channelColors: Color[];
     private opacity: number;
+    private shader: string;
     private viewerDriver: NeuroglancerDriver;
     private readonly name: string;
 
@@ -75,10 +76,9 @@ class Layer{
         this.name = params.name
         this.channelColors = params.channelColors
         this.opacity = params.opacity
+        this.shader = Layer.makeShader({channelColors: this.channelColors, opacity: this.opacity})
         this.viewerDriver = params.viewerDriver
-        this.reconfigure({
-            isVisible: params.isVisible, channelColors: params.channelColors, opacity: params.opacity
-        })
+        this.reconfigure({isVisible: params.isVisible})
     }
 
     public getState(): LayerRawState{
@@ -138,8 +138,10 @@ class Layer{
     }){
         this.channelColors = params.channelColors || this.channelColors
         this.opacity = params.opacity === undefined ? this.opacity : params.opacity;
-
-
+        // toggling visibility or changing the url is far more common than recoloring, so only rebuild the shader when needed
+        if(params.channelColors !== undefined || params.opacity !== undefined){
+            this.shader = Layer.makeShader({channelColors: this.channelColors, opacity: this.opacity})
+        }
 
         let viewerState = this.viewerDriver.getState()
         let layerState = viewerState.layers.find(l => l.name == this.name)!
@@ -147,7 +149,7 @@ class Layer{
             layerState.url = params.url.double_protocol_raw
         }
 
-        layerState.shader = Layer.makeShader({channelColors: this.channelColors, opacity: this.opacity})
+        layerState.shader = this.shader
         if(params.isVisible !== undefined){
             layerState.visible = params.isVisible
         }
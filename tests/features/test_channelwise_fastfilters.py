@@ -1,10 +1,149 @@
+import pickle
+from typing import Any, List
+
+import numpy as np
+from ndstructs.array5D import Array5D
+from ndstructs.point5D import Shape5D
+
 from tests import get_sample_c_cells_datasource
+from webilastik.datasource import DataRoi
+from webilastik.datasource.array_datasource import ArrayDataSource
 from webilastik.features.channelwise_fastfilters import (
-    GaussianSmoothing
+    Axis2D,
+    ChannelwiseFastFilter,
+    DifferenceOfGaussians,
+    GaussianGradientMagnitude,
+    GaussianSmoothing,
+    HessianOfGaussianEigenvalues,
+    LaplacianOfGaussian,
+    StructureTensorEigenvalues,
 )
+from webilastik.features.ilp_filter import (
+    IlpDifferenceOfGaussians,
+    IlpGaussianSmoothing,
+    IlpHessianOfGaussianEigenvalues,
+    IlpStructureTensorEigenvalues,
+)
+from webilastik.operator import OpRetriever
+from webilastik.features import ndimage_filters
+
+def test_presmoothers_of_same_scale_are_shared():
+    smoothing = IlpGaussianSmoothing(ilp_scale=1.6, axis_2d="z")
+    hessian = IlpHessianOfGaussianEigenvalues(ilp_scale=1.6, axis_2d="z")
+    assert smoothing.presmoother == hessian.presmoother
+    assert hash(smoothing.presmoother) == hash(hessian.presmoother)
+
+def test_presmoothing_is_shared_by_filters_of_different_radii():
+    class CountingRetriever(OpRetriever):
+        def __init__(self) -> None:
+            self.retrieved_rois: List[DataRoi] = []
+            super().__init__(axiskeys_hint="ctzyx")
+
+        def __call__(self, /, roi: DataRoi) -> Array5D:
+            self.retrieved_rois.append(roi)
+            return super().__call__(roi)
+
+    retriever = CountingRetriever()
+    filters = [
+        IlpGaussianSmoothing(ilp_scale=1.6, axis_2d="z", preprocessor=retriever),
+        IlpDifferenceOfGaussians(ilp_scale=1.6, axis_2d="z", preprocessor=retriever),
+        IlpStructureTensorEigenvalues(ilp_scale=1.6, axis_2d="z", preprocessor=retriever),
+    ]
+    assert len({fx.op.kernel_radius for fx in filters}) > 1
+    assert len({fx.op.halo for fx in filters}) == 1
+
+    data = Array5D(np.random.rand(60, 70).astype(np.float32), axiskeys="yx")
+    roi = DataRoi(ArrayDataSource(data=data, tile_shape=Shape5D(x=32, y=32))).updated(x=(16, 48), y=(16, 48))
+    for fx in filters:
+        features = fx(roi)
+        assert features.interval.updated(c=(0, 1)) == roi.interval.updated(c=(0, 1))
+    # the presmoother ran (and retrieved raw data) only once for all filters
+    assert len(retriever.retrieved_rois) == 1
+
+def test_cached_hash_does_not_leak_into_equality_or_pickles():
+    smoothing = IlpGaussianSmoothing(ilp_scale=1.6, axis_2d="z")
+    _ = hash(smoothing)
+    assert smoothing == IlpGaussianSmoothing(ilp_scale=1.6, axis_2d="z")
+    assert smoothing != IlpGaussianSmoothing(ilp_scale=3.5, axis_2d="z")
+    assert "_hash" not in pickle.loads(pickle.dumps(smoothing)).__dict__
+
+def test_ndimage_hessian_eigenvalues_are_sorted_and_sum_to_laplacian():
+    data = np.random.rand(10, 20, 30).astype(np.float32)
+    eigenvalues = ndimage_filters.hessianOfGaussianEigenvalues(data, scale=1.0)
+    assert eigenvalues.shape == data.shape + (3,)
+    assert np.all(eigenvalues[..., :-1] >= eigenvalues[..., 1:])
+    laplacian = ndimage_filters.laplacianOfGaussian(data, scale=1.0)
+    assert np.allclose(eigenvalues.sum(axis=-1), laplacian, atol=1e-4)
+
+def _create_filters(axis_2d: "Axis2D | None") -> List[ChannelwiseFastFilter]:
+    return [
+        GaussianSmoothing(sigma=1.5, axis_2d=axis_2d),
+        GaussianGradientMagnitude(sigma=1.0, axis_2d=axis_2d),
+        DifferenceOfGaussians(sigma0=1.0, sigma1=2.0, axis_2d=axis_2d),
+        HessianOfGaussianEigenvalues(scale=1.2, axis_2d=axis_2d),
+        LaplacianOfGaussian(scale=1.0, axis_2d=axis_2d),
+        StructureTensorEigenvalues(innerScale=1.0, outerScale=0.5, axis_2d=axis_2d),
+    ]
+
+def _filter_whole_image(fx: ChannelwiseFastFilter, data: Array5D) -> "np.ndarray[Any, Any]":
+    """Applies fx.filter_fn to all of data at once, in tzyxc. Like the datasources, the image is padded with
+    zeros as far as the filter's halo reaches"""
+    assert fx.axis_2d in (None, "z")
+    halo = fx.halo
+    raw = np.pad(
+        data.raw("tczyx").astype(np.float32),
+        [(0, 0), (0, 0), (halo.z, halo.z), (halo.y, halo.y), (halo.x, halo.x)],
+    )
+    crop = (slice(halo.y, raw.shape[3] - halo.y), slice(halo.x, raw.shape[4] - halo.x))
+    out = np.zeros((data.shape.t, data.shape.z, data.shape.y, data.shape.x, data.shape.c * fx.channel_multiplier), dtype=np.float32)
+    for t, c in np.ndindex(*raw.shape[:2]):
+        channels = slice(c * fx.channel_multiplier, (c + 1) * fx.channel_multiplier)
+        if fx.axis_2d == "z":
+            for z in range(raw.shape[2]):
+                filtered = fx.filter_fn(np.ascontiguousarray(raw[t, c, z]))
+                out[t, z, :, :, channels] = filtered.reshape(*filtered.shape[:2], -1)[crop]
+        else:
+            filtered = fx.filter_fn(np.ascontiguousarray(raw[t, c]))
+            out[t, :, :, :, channels] = filtered.reshape(*filtered.shape[:3], -1)[(slice(halo.z, raw.shape[2] - halo.z), *crop)]
+    return out
+
+def _check_tiles_against_whole_image(datasource: ArrayDataSource, data: Array5D, axis_2d: "Axis2D | None"):
+    for fx in _create_filters(axis_2d=axis_2d):
+        expected = _filter_whole_image(fx, data)
+        tiles = list(DataRoi(datasource).get_datasource_tiles())
+        assert len(tiles) > 1
+        for tile in tiles:
+            features = fx(tile)
+            assert features.interval.updated(c=(0, 1)) == tile.interval.updated(c=(0, 1))
+            expected_tile = expected[
+                tile.t[0]:tile.t[1],
+                tile.z[0]:tile.z[1],
+                tile.y[0]:tile.y[1],
+                tile.x[0]:tile.x[1],
+                tile.c[0] * fx.channel_multiplier:tile.c[1] * fx.channel_multiplier,
+            ]
+            np.testing.assert_allclose(features.raw("tzyxc"), expected_tile, rtol=1e-4, atol=1e-4, err_msg=f"{fx} on {tile}")
+
+def test_tiled_features_match_whole_image_features_2d():
+    # tiles that don't divide the image evenly, so that there are partial tiles on the edges
+    data = Array5D(np.random.rand(2, 30, 41).astype(np.float32) * 100, axiskeys="cyx")
+    datasource = ArrayDataSource(data=data, tile_shape=Shape5D(x=16, y=16, c=2))
+    _check_tiles_against_whole_image(datasource, data, axis_2d="z")
+
+def test_tiled_features_match_whole_image_features_3d():
+    data = Array5D(np.random.rand(13, 20, 18).astype(np.float32) * 100, axiskeys="zyx")
+    datasource = ArrayDataSource(data=data, tile_shape=Shape5D(x=8, y=8, z=8))
+    _check_tiles_against_whole_image(datasource, data, axis_2d=None)
+    _check_tiles_against_whole_image(datasource, data, axis_2d="z")
 
 if __name__ == "__main__":
+    test_presmoothers_of_same_scale_are_shared()
+    test_presmoothing_is_shared_by_filters_of_different_radii()
+    test_cached_hash_does_not_leak_into_equality_or_pickles()
+    test_ndimage_hessian_eigenvalues_are_sorted_and_sum_to_laplacian()
+    test_tiled_features_match_whole_image_features_2d()
+    test_tiled_features_match_whole_image_features_3d()
     ds = get_sample_c_cells_datasource()
     feature_extractor = GaussianSmoothing(axis_2d="z", sigma=3.0)
     for tile in ds.roi.get_datasource_tiles():
-        _ = feature_extractor(tile)#.show_images()
\ No newline at end of file
+        _ = feature_extractor(tile)#.show_images()
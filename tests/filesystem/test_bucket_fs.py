@@ -0,0 +1,297 @@
+# pyright: strict
+
+from datetime import datetime, timezone
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional, Sequence, Tuple
+import time
+
+from ndstructs.utils.json_serializable import JsonValue
+
+from webilastik.filesystem import FsFileNotFoundException, FsIoException
+from webilastik.filesystem.bucket_fs import BucketFs, ReadAheadBucketFs, _ObjectUrlCache # pyright: ignore [reportPrivateUsage]
+from webilastik.utility import Seconds
+from webilastik.utility.url import Url
+
+
+class _InMemoryBucketFs(BucketFs):
+    """A BucketFs whose objects live in a dict instead of behind the data proxy"""
+
+    def __init__(self, bucket_name: str = "test-bucket"):
+        self.files: Dict[PurePosixPath, bytes] = {}
+        self.reads: List[Tuple[PurePosixPath, int, "int | None"]] = []
+        self.listings: List[Tuple[PurePosixPath, Optional[int], Optional[str]]] = []
+        self.size_lookups: List[PurePosixPath] = []
+        super().__init__(bucket_name=bucket_name)
+
+    def read_file(
+        self, path: PurePosixPath, offset: int = 0, num_bytes: "int | None" = None
+    ) -> "bytes | FsIoException | FsFileNotFoundException":
+        self.reads.append((path, offset, num_bytes))
+        contents = self.files.get(path)
+        if contents is None:
+            return FsFileNotFoundException(path)
+        return contents[offset:] if num_bytes is None else contents[offset : offset + num_bytes]
+
+    async def _read_file_async(
+        self, path: PurePosixPath, offset: int, num_bytes: "int | None"
+    ) -> "bytes | FsIoException | FsFileNotFoundException":
+        return self.read_file(path, offset=offset, num_bytes=num_bytes)
+
+    def _fetch_listing(
+        self, path: PurePosixPath, limit: Optional[int], marker: Optional[str] = None
+    ) -> "Sequence[JsonValue] | FsIoException":
+        self.listings.append((path, limit, marker))
+        prefix = "" if path.as_posix() == "/" else path.as_posix().strip("/") + "/"
+        keys = sorted(p.as_posix().lstrip("/") for p in self.files)
+        entries: List[JsonValue] = []
+        subdirs: List[str] = []
+        for key in keys:
+            if not key.startswith(prefix):
+                continue
+            rest = key[len(prefix):]
+            if "/" in rest:
+                subdir = prefix + rest.split("/")[0] + "/"
+                if subdir not in subdirs:
+                    subdirs.append(subdir)
+                    entries.append({"subdir": subdir})
+            else:
+                entries.append({"name": key, "bytes": len(self.files[PurePosixPath("/", key)])})
+        if marker is not None:
+            entries = [e for e in entries if isinstance(e, dict) and str(e.get("subdir") or e.get("name")) > marker]
+        return entries if limit is None else entries[:limit]
+
+    def get_size(self, path: PurePosixPath) -> "int | FsIoException | FsFileNotFoundException":
+        self.size_lookups.append(path)
+        contents = self.files.get(path)
+        if contents is None:
+            return FsFileNotFoundException(path)
+        return len(contents)
+
+    def create_file(self, *, path: PurePosixPath, contents: bytes) -> "None | FsIoException":
+        self.files[path] = contents
+        return None
+
+    def delete(
+        self,
+        path: PurePosixPath,
+        dir_wait_time: Seconds = Seconds(5),
+        dir_wait_interval: Seconds = Seconds(0.05),
+    ) -> "None | FsIoException":
+        for file_path in list(self.files.keys()):
+            if file_path == path or path in file_path.parents:
+                del self.files[file_path]
+        return None
+
+class _InMemoryReadAheadBucketFs(ReadAheadBucketFs, _InMemoryBucketFs):
+    pass
+
+def _create_fs(files: Dict[PurePosixPath, bytes]) -> _InMemoryBucketFs:
+    fs = _InMemoryBucketFs()
+    fs.files.update(files)
+    return fs
+
+def _create_readahead_fs(files: Dict[PurePosixPath, bytes], readahead: int, max_windows: int) -> _InMemoryReadAheadBucketFs:
+    fs = _InMemoryReadAheadBucketFs(bucket_name="test-bucket", readahead=readahead, max_windows=max_windows)
+    fs.files.update(files)
+    return fs
+
+
+def test_readahead_hits_and_misses():
+    contents = bytes(range(256)) * 4 # 1024 bytes
+    path = PurePosixPath("/some/file.bin")
+    fs = _create_readahead_fs({path: contents}, readahead=100, max_windows=2)
+
+    assert fs.read_file(path, offset=10, num_bytes=5) == contents[10:15]
+    assert fs.reads == [(path, 10, 100)]
+
+    # everything within [10, 110) is served from the window
+    assert fs.read_file(path, offset=10, num_bytes=100) == contents[10:110] # num_bytes >= readahead bypasses windows
+    assert fs.read_file(path, offset=10, num_bytes=99) == contents[10:109]
+    assert fs.read_file(path, offset=109, num_bytes=1) == contents[109:110]
+    assert len(fs.reads) == 2
+
+    # reads starting before the window, at its end or spilling past it go back to the bucket
+    assert fs.read_file(path, offset=9, num_bytes=2) == contents[9:11]
+    assert fs.reads[-1] == (path, 9, 100)
+    assert fs.read_file(path, offset=108, num_bytes=3) == contents[108:111]
+    assert fs.reads[-1] == (path, 108, 100)
+    assert fs.read_file(path, offset=208, num_bytes=1) == contents[208:209]
+    assert fs.reads[-1] == (path, 208, 100)
+    assert len(fs.reads) == 5
+
+def test_readahead_truncates_at_eof():
+    contents = b"0123456789" * 5 # 50 bytes, shorter than the readahead
+    path = PurePosixPath("/short.txt")
+    fs = _create_readahead_fs({path: contents}, readahead=100, max_windows=2)
+
+    assert fs.read_file(path, offset=40, num_bytes=5) == contents[40:45]
+    assert len(fs.reads) == 1
+    # the window reaches the end of the file, so reads past it are truncated instead of refetched
+    assert fs.read_file(path, offset=45, num_bytes=20) == contents[45:]
+    assert fs.read_file(path, offset=49, num_bytes=10) == contents[49:]
+    assert len(fs.reads) == 1
+    # nothing in the window starts at the end of the file
+    assert fs.read_file(path, offset=50, num_bytes=10) == b""
+    assert len(fs.reads) == 2
+
+def test_readahead_evicts_least_recently_used_window():
+    files = {PurePosixPath(f"/file_{i}"): bytes([i]) * 1000 for i in range(3)}
+    path_0, path_1, path_2 = files.keys()
+    fs = _create_readahead_fs(files, readahead=100, max_windows=2)
+
+    assert fs.read_file(path_0, offset=0, num_bytes=1) == b"\x00"
+    assert fs.read_file(path_1, offset=0, num_bytes=1) == b"\x01"
+    assert fs.read_file(path_0, offset=1, num_bytes=1) == b"\x00" # refreshes path_0's window
+    assert len(fs.reads) == 2
+
+    assert fs.read_file(path_2, offset=0, num_bytes=1) == b"\x02" # evicts path_1, the least recently used
+    assert len(fs.reads) == 3
+    assert fs.read_file(path_0, offset=2, num_bytes=1) == b"\x00"
+    assert len(fs.reads) == 3
+    assert fs.read_file(path_1, offset=1, num_bytes=1) == b"\x01"
+    assert len(fs.reads) == 4
+
+def test_readahead_forgets_windows_on_write_and_delete():
+    file_path = PurePosixPath("/dir/file")
+    other_path = PurePosixPath("/other")
+    fs = _create_readahead_fs({file_path: b"a" * 200, other_path: b"o" * 200}, readahead=100, max_windows=8)
+
+    assert fs.read_file(file_path, offset=0, num_bytes=1) == b"a"
+    assert fs.read_file(other_path, offset=0, num_bytes=1) == b"o"
+    assert fs.create_file(path=file_path, contents=b"b" * 200) is None
+    assert fs.read_file(file_path, offset=0, num_bytes=1) == b"b"
+    assert len(fs.reads) == 3
+
+    # deleting a directory forgets the windows of everything under it, and nothing else
+    assert fs.delete(PurePosixPath("/dir")) is None
+    assert isinstance(fs.read_file(file_path, offset=0, num_bytes=1), FsFileNotFoundException)
+    assert fs.read_file(other_path, offset=1, num_bytes=1) == b"o"
+    assert len(fs.reads) == 4
+
+
+def test_read_files():
+    files = {PurePosixPath(f"/file_{i}"): f"contents of {i}".encode("utf8") for i in range(20)}
+    fs = _create_fs(files)
+    paths = [*files.keys(), PurePosixPath("/missing")]
+
+    results = fs.read_files(paths)
+    assert results[:-1] == list(files.values()) # results come back in the same order as the paths
+    assert isinstance(results[-1], FsFileNotFoundException)
+    assert fs.read_files([]) == []
+    assert fs.read_files(paths[:1]) == [files[paths[0]]]
+
+
+def test_list_contents_all_pages_through_listing():
+    files = {PurePosixPath(f"/dir/file_{i:03}"): b"x" * i for i in range(25)}
+    files[PurePosixPath("/dir/sub/nested")] = b"nested"
+    files[PurePosixPath("/elsewhere")] = b"elsewhere"
+    fs = _create_fs(files)
+
+    pages = list(fs.list_contents_all(PurePosixPath("/dir"), page_size=10))
+    assert len(pages) == 3
+    listed_files: List[PurePosixPath] = []
+    listed_directories: List[PurePosixPath] = []
+    listed_sizes: Dict[PurePosixPath, int] = {}
+    for page in pages:
+        assert not isinstance(page, Exception)
+        listed_files += page.files
+        listed_directories += page.directories
+        listed_sizes.update(page.file_sizes)
+    assert listed_files == [PurePosixPath(f"/dir/file_{i:03}") for i in range(25)]
+    assert listed_directories == [PurePosixPath("/dir/sub")]
+    assert listed_sizes == {PurePosixPath(f"/dir/file_{i:03}"): i for i in range(25)}
+    # each page continues after the last key of the previous one
+    assert [marker for (_, _, marker) in fs.listings] == [None, "dir/file_009", "dir/file_019"]
+
+def test_list_contents_all_with_exactly_full_pages():
+    files = {PurePosixPath(f"/file_{i}"): b"" for i in range(6)}
+    fs = _create_fs(files)
+
+    pages = list(fs.list_contents_all(PurePosixPath("/"), page_size=3))
+    # a full last page can't be told apart from a partial listing, so it's followed by an empty one
+    assert len(pages) == 3
+    last_page = pages[-1]
+    assert not isinstance(last_page, Exception)
+    assert last_page.files == [] and last_page.directories == []
+
+def test_list_contents_all_stops_on_error():
+    class _FailingListingFs(_InMemoryBucketFs):
+        def _fetch_listing(
+            self, path: PurePosixPath, limit: Optional[int], marker: Optional[str] = None
+        ) -> "Sequence[JsonValue] | FsIoException":
+            if marker is not None:
+                return FsIoException("listing failed")
+            return super()._fetch_listing(path, limit, marker)
+
+    fs = _FailingListingFs()
+    fs.files.update({PurePosixPath(f"/file_{i}"): b"" for i in range(5)})
+    pages = list(fs.list_contents_all(PurePosixPath("/"), page_size=2))
+    assert len(pages) == 2
+    assert not isinstance(pages[0], Exception)
+    assert isinstance(pages[1], FsIoException)
+
+
+def test_get_sizes():
+    listed_paths = [PurePosixPath("/a/one"), PurePosixPath("/a/two"), PurePosixPath("/b/three")]
+    unlisted_path = PurePosixPath("/a/unlisted")
+    missing_path = PurePosixPath("/b/missing")
+
+    class _ListingWithoutSomeFilesFs(_InMemoryBucketFs):
+        def _fetch_listing(
+            self, path: PurePosixPath, limit: Optional[int], marker: Optional[str] = None
+        ) -> "Sequence[JsonValue] | FsIoException":
+            listing = super()._fetch_listing(path, limit, marker)
+            assert not isinstance(listing, Exception)
+            return [entry for entry in listing if not (isinstance(entry, dict) and entry.get("name") == "a/unlisted")]
+
+    fs = _ListingWithoutSomeFilesFs()
+    fs.files.update({path: b"x" * (i + 1) for i, path in enumerate([*listed_paths, unlisted_path])})
+    sizes = fs.get_sizes([*listed_paths, unlisted_path, missing_path])
+    assert sizes[PurePosixPath("/a/one")] == 1
+    assert sizes[PurePosixPath("/a/two")] == 2
+    assert sizes[PurePosixPath("/b/three")] == 3
+    # files that are not in their parent's listing are looked up one by one
+    assert sizes[unlisted_path] == 4
+    assert isinstance(sizes[missing_path], FsFileNotFoundException)
+    assert fs.size_lookups == [unlisted_path, missing_path]
+    # one listing per parent directory
+    assert sorted(path.as_posix() for (path, _, _) in fs.listings) == ["/a", "/b"]
+
+
+def test_object_url_cache_expiry():
+    margin = _ObjectUrlCache.EXPIRY_MARGIN
+
+    swift_url = Url.parse_or_raise(
+        f"https://object.cscs.ch/v1/AUTH_abc/bucket/obj?temp_url_sig=123&temp_url_expires={int(time.time()) + 1000}"
+    )
+    swift_expiry = _ObjectUrlCache._get_expiry(swift_url) # pyright: ignore [reportPrivateUsage]
+    assert abs(swift_expiry - (time.monotonic() + 1000 - margin)) < 5
+
+    signed_at = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    s3_url = Url.parse_or_raise(
+        f"https://s3.example.com/bucket/obj?X-Amz-Date={signed_at}&X-Amz-Expires=600&X-Amz-Signature=abc"
+    )
+    s3_expiry = _ObjectUrlCache._get_expiry(s3_url) # pyright: ignore [reportPrivateUsage]
+    assert abs(s3_expiry - (time.monotonic() + 600 - margin)) < 5
+
+    # URLs without (parseable) expiry information are kept for FALLBACK_TTL
+    for url in [
+        Url.parse_or_raise("https://object.cscs.ch/v1/AUTH_abc/bucket/obj"),
+        Url.parse_or_raise("https://object.cscs.ch/v1/AUTH_abc/bucket/obj?temp_url_expires=soon"),
+        Url.parse_or_raise("https://s3.example.com/bucket/obj?X-Amz-Date=yesterday&X-Amz-Expires=600"),
+    ]:
+        expiry = _ObjectUrlCache._get_expiry(url) # pyright: ignore [reportPrivateUsage]
+        assert abs(expiry - (time.monotonic() + _ObjectUrlCache.FALLBACK_TTL - margin)) < 5
+
+
+if __name__ == "__main__":
+    test_readahead_hits_and_misses()
+    test_readahead_truncates_at_eof()
+    test_readahead_evicts_least_recently_used_window()
+    test_readahead_forgets_windows_on_write_and_delete()
+    test_read_files()
+    test_list_contents_all_pages_through_listing()
+    test_list_contents_all_with_exactly_full_pages()
+    test_list_contents_all_stops_on_error()
+    test_get_sizes()
+    test_object_url_cache_expiry()
@@ -32,11 +32,13 @@ def test_osfs_bucketfs():
         listing_result = fs.list_contents(file_path.parent)
         assert not isinstance(listing_result, Exception)
         assert file_path in listing_result.files
+        assert file_path in listing_result
 
         assert not isinstance(fs.delete(file_path), Exception)
         listing_result = fs.list_contents(file_path.parent)
         assert not isinstance(listing_result, Exception)
         assert file_path not in listing_result.files
+        assert file_path not in listing_result
 
 
 def test_zip_fs():
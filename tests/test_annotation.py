@@ -1,4 +1,6 @@
+from typing import List
 from ndstructs.point5D import Point5D
+from ndstructs.array5D import Array5D
 from webilastik.annotations import Annotation
 from tests import get_sample_c_cells_datasource
 from webilastik.annotations.annotation import Color
@@ -24,6 +26,42 @@ def test_collision_clearing():
     # a2.show(color=Color(g=np.uint8(255)))
 
 
+def test_color_sorting():
+    red = Color(r=np.uint8(255))
+    green = Color(g=np.uint8(255))
+    blue = Color(b=np.uint8(255))
+    assert red.q_rgba == 0xFF0000
+    assert (red.r, red.g, red.b) == (255, 0, 0)
+    assert red == Color(r=np.uint8(255), name="other name") and red != green and red != "red"
+    assert Color.sort([red, blue, green]) == [blue, green, red]
+    assert Color.create_color_map([green, red, green, blue]) == {blue: 1, green: 2, red: 3}
+
+
+def test_interpolation_matches_point_interpolation():
+    raw_data = get_sample_c_cells_datasource()
+    polylines: List[List[Point5D]] = [
+        # segments where delta * (i / steps) and (delta / steps) * i round differently
+        [Point5D(x=0, y=0), Point5D(x=22, y=11)],
+        [Point5D(x=0, y=0), Point5D(x=22, y=15)],
+        [Point5D(x=0, y=12), Point5D(x=22, y=1)],
+        [Point5D(x=0, y=0), Point5D(x=11, y=22), Point5D(x=26, y=0), Point5D(x=0, y=13)],
+        [Point5D(x=40, y=30)],
+        [Point5D(x=10, y=10), Point5D(x=10, y=10), Point5D(x=30, y=17), Point5D(x=30, y=17), Point5D(x=12, y=40)],
+    ]
+    for voxels in polylines:
+        annotation = Annotation.interpolate_from_points(voxels=voxels, raw_data=raw_data)
+
+        expected = Array5D.allocate(annotation.interval, dtype=np.dtype(bool), value=False)
+        anchor = voxels[0]
+        for voxel in voxels:
+            for interp_voxel in anchor.interpolate_until(voxel):
+                expected.paint_point(point=interp_voxel, value=True)
+            anchor = voxel
+
+        assert (annotation.raw("tzyxc") == expected.raw("tzyxc")).all(), f"Different rasterization of {voxels}"
+
 
 if __name__ == "__main__":
-    test_collision_clearing()
\ No newline at end of file
+    test_collision_clearing()
+    test_color_sorting()
+    test_interpolation_matches_point_interpolation()
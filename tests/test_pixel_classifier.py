@@ -81,7 +81,35 @@ def test_pixel_classifier():
     predictions2 = loaded_classifier(datasource.roi)
     assert predictions2 == predictions1
 
+def test_batched_predictions_match_single_predictions():
+    labels = tests.get_sample_c_cells_pixel_annotations()
+    classifier = VigraPixelClassifier.train(
+        feature_extractors=[
+            IlpGaussianSmoothing(ilp_scale=1.0, axis_2d="z"),
+            IlpHessianOfGaussianEigenvalues(ilp_scale=1.6, axis_2d="z"),
+        ],
+        label_classes=[label.annotations for label in labels],
+        num_trees=10,
+        num_forests=2,
+    )
+    if isinstance(classifier, Exception):
+        raise classifier
+
+    datasource = labels[0].annotations[0].raw_data
+    rois = [
+        next(datasource.roi.get_datasource_tiles()),
+        datasource.roi.updated(x=(0, 64), y=(0, 64)),
+        datasource.roi.updated(x=(100, 137), y=(20, 51)),
+        datasource.roi.updated(x=(10, 11), y=(200, 233)),
+    ]
+    batched_predictions = classifier.predict_batch(rois)
+    assert len(batched_predictions) == len(rois)
+    for roi, batched in zip(rois, batched_predictions):
+        single = classifier(roi)
+        assert batched.interval == single.interval
+        assert np.allclose(batched.raw("tzyxc"), single.raw("tzyxc"))
 
 
 if __name__ == "__main__":
-    test_pixel_classifier()
\ No newline at end of file
+    test_pixel_classifier()
+    test_batched_predictions_match_single_predictions()
\ No newline at end of file
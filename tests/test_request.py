@@ -0,0 +1,58 @@
+# pyright: strict
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+import gzip
+import threading
+
+import requests
+
+from webilastik.utility.request import request
+from webilastik.utility.url import Url
+
+_BODY = bytes(range(256)) * 4096 # 1 MiB, compressible
+
+class _RangeIgnoringHandler(BaseHTTPRequestHandler):
+    """Always answers with the full body and a 200, whatever the Range header says"""
+
+    def do_GET(self):
+        if self.path.startswith("/gzip"):
+            payload = gzip.compress(_BODY)
+            encoding_headers = {"Content-Encoding": "gzip"}
+        else:
+            payload = _BODY
+            encoding_headers = {}
+        self.send_response(200)
+        for header_name, header_value in {**encoding_headers, "Content-Length": str(len(payload))}.items():
+            self.send_header(header_name, header_value)
+        self.end_headers()
+        try:
+            _ = self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # clients are expected to hang up early
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+def test_ranged_request_to_server_that_ignores_range():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeIgnoringHandler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    try:
+        session = requests.Session()
+        for path in ("/plain", "/gzip"):
+            url = Url.parse_or_raise(f"http://127.0.0.1:{server.server_address[1]}{path}")
+            for num_bytes in (1, 100, 5000, 100_000):
+                result = request(session=session, method="get", url=url, num_bytes=num_bytes)
+                assert not isinstance(result, Exception), str(result)
+                assert result[0] == _BODY[:num_bytes], f"{path}: expected {num_bytes} bytes, got {len(result[0])}"
+
+            full_result = request(session=session, method="get", url=url)
+            assert not isinstance(full_result, Exception), str(full_result)
+            assert full_result[0] == _BODY
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    test_ranged_request_to_server_that_ignores_range()
@@ -38,6 +38,8 @@ class Group(HLObject, MutableMappingHDF5):
         dtype: "numpy.dtype[Any] | None" = None,
         data: DatasetContents,
         compression: "Literal['gzip', 'szip', 'lzf'] | Literal[0, 1, 2, 3, 4, 5, 6, 7, 8, 9] | None" = None,
+        compression_opts: "int | None" = None,
+        shuffle: "bool | None" = None,
         chunks: "Tuple[int, ...] | None" = None
     ) -> Dataset:
         """ Create a new HDF5 dataset
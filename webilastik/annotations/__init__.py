@@ -1,2 +1,2 @@
 # pyright: reportUnusedImport=false
-from .annotation import Annotation, FeatureSamples, Color
+from .annotation import Annotation, FeatureSamples, Color, build_tile_index, get_feature_samples
@@ -1,5 +1,7 @@
 from functools import partial
-from typing import List, Sequence, Tuple, Dict, Iterable, Sequence, Any
+import hashlib
+import operator
+from typing import Iterator, List, Sequence, Tuple, Dict, Iterable, Sequence, Any
 
 import numpy as np
 from ndstructs.point5D import Interval5D, Point5D
@@ -20,13 +22,24 @@ class Color:
         b: np.uint8 = np.uint8(0),
         name: str = "",
     ):
-        self.r = r
-        self.g = g
-        self.b = b
+        # channels are packed into a single int so that hashing, comparing and sorting colors are integer operations
+        self._q_rgba: int = (int(r) << 16) | (int(g) << 8) | int(b)
         self.name = name or f"Label {self.rgba}"
         self.hex_code = f"#{r:02X}{g:02X}{b:02X}"
         super().__init__()
 
+    @property
+    def r(self) -> np.uint8:
+        return np.uint8((self._q_rgba >> 16) & 0xFF)
+
+    @property
+    def g(self) -> np.uint8:
+        return np.uint8((self._q_rgba >> 8) & 0xFF)
+
+    @property
+    def b(self) -> np.uint8:
+        return np.uint8(self._q_rgba & 0xFF)
+
     def to_dto(self) -> ColorDto:
         return ColorDto(r=int(self.r), g=int(self.g), b=int(self.b))
 
@@ -44,25 +57,30 @@ class Color:
 
     @property
     def q_rgba(self) -> int:
-        return sum(c * (16 ** (3 - idx)) for idx, c in enumerate(self.rgba))
+        return self._q_rgba
 
     @property
     def ilp_data(self) -> "np.ndarray[Any, Any]":
         return np.asarray(self.rgba, dtype=np.int64)
 
     def __hash__(self):
-        return hash(self.rgba)
+        return self._q_rgba
 
     def __eq__(self, other: object) -> bool:
-        return not isinstance(other, Color) or self.rgba == other.rgba
+        return isinstance(other, Color) and self._q_rgba == other._q_rgba
 
     @classmethod
     def sort(cls, colors: Iterable["Color"]) -> List["Color"]:
-        return sorted(colors, key=lambda c: c.q_rgba)
+        return sorted(colors, key=operator.attrgetter("_q_rgba"))
 
     @classmethod
     def create_color_map(cls, colors: Iterable["Color"]) -> Dict["Color", np.uint8]:
-        return {color: np.uint8(idx + 1) for idx, color in enumerate(cls.sort(set(colors)))}
+        colors_by_q_rgba: Dict[int, Color] = {}
+        for color in colors:
+            _ = colors_by_q_rgba.setdefault(color.q_rgba, color)
+        # keys are already unique, so sorting them is enough
+        sorted_q_rgbas = np.sort(np.fromiter(colors_by_q_rgba.keys(), dtype=np.uint32, count=len(colors_by_q_rgba)))
+        return {colors_by_q_rgba[int(q_rgba)]: np.uint8(idx + 1) for idx, q_rgba in enumerate(sorted_q_rgbas)}
 
     def __repr__(self) -> str:
         return f"<{self.__class__.__name__} r={self.r} g={self.g} b={self.b}>"
@@ -81,23 +99,86 @@ class FeatureSamples(FeatureData, StaticLine):
         return self.linear_raw()
 
     def get_y(self, label_class: np.uint8) -> "np.ndarray[Any, np.dtype[np.uint32]]":
-        return np.full((self.shape.volume, 1), label_class, dtype=np.uint32)
+        # read-only view; callers that need to write into it must copy it first
+        return np.broadcast_to(np.uint32(label_class), (self.shape.volume, 1))
 
 
 class AnnotationOutOfBounds(Exception):
     def __init__(self, annotation_roi: Interval5D, raw_data: DataSource):
         super().__init__(f"Annotation roi {annotation_roi} exceeds bounds of raw_data {raw_data}")
 
-def _make_samples(data_tile: DataRoi, annotation: "Annotation", feature_extractor: FeatureExtractor) -> FeatureSamples:
-    annotation_tile = annotation.clamped(data_tile)
-    feature_tile = feature_extractor(data_tile).cut(annotation_tile.interval, c=All())
-    return FeatureSamples.create(annotation_tile, feature_tile)
+def _get_data_tiles(annotation: "Annotation") -> Iterator[DataRoi]:
+    interval_under_annotation = annotation.interval.updated(c=annotation.raw_data.interval.c)
+    tile_shape = annotation.raw_data.tile_shape.updated(c=annotation.raw_data.shape.c)
+    return annotation.raw_data.roi.clamped(interval_under_annotation).get_tiles(
+        tile_shape=tile_shape, tiles_origin=annotation.raw_data.location
+    )
+
+def build_tile_index(annotations: Iterable["Annotation"]) -> Dict[DataRoi, List["Annotation"]]:
+    """Maps every data tile under any of the annotations to all annotations that touch that tile"""
+    tile_index: Dict[DataRoi, List["Annotation"]] = {}
+    for annotation in annotations:
+        for data_tile in _get_data_tiles(annotation):
+            tile_index.setdefault(data_tile, []).append(annotation)
+    return tile_index
+
+def _make_samples(
+    data_tile: DataRoi, annotations: Sequence["Annotation"], feature_extractor: FeatureExtractor
+) -> List[FeatureSamples]:
+    feature_tile = feature_extractor(data_tile)
+    out: List[FeatureSamples] = []
+    for annotation in annotations:
+        annotation_tile = annotation.clamped(data_tile)
+        out.append(FeatureSamples.create(annotation_tile, feature_tile.cut(annotation_tile.interval, c=All())))
+    return out
+
+def get_feature_samples(annotations: Sequence["Annotation"], feature_extractor: FeatureExtractor) -> List[FeatureSamples]:
+    """Samples the features under each of the annotations. Features are computed only once per data tile,
+    regardless of how many annotations touch that tile"""
+    unique_annotations = list({id(annotation): annotation for annotation in annotations}.values())
+    tile_index = build_tile_index(unique_annotations)
+
+    make_samples_on_tile = partial(_make_samples, feature_extractor=feature_extractor)
+    samples_per_tile: Iterable[List[FeatureSamples]]
+    if len(tile_index) == 1:
+        # small annotations usually fit in a single tile; don't pay for dispatching to the executor
+        samples_per_tile = [make_samples_on_tile(*next(iter(tile_index.items())))]
+    else:
+        executor = get_executor(hint="sampling", max_workers=len(tile_index))
+        samples_per_tile = executor.map(make_samples_on_tile, tile_index.keys(), tile_index.values())
+    samples: Dict[Tuple[int, DataRoi], FeatureSamples] = {}
+    for (data_tile, tile_annotations), tile_samples in zip(tile_index.items(), samples_per_tile):
+        for annotation, annotation_samples in zip(tile_annotations, tile_samples):
+            samples[(id(annotation), data_tile)] = annotation_samples
+
+    out: List[FeatureSamples] = []
+    for annotation in annotations:
+        annotation_samples = [samples[(id(annotation), data_tile)] for data_tile in _get_data_tiles(annotation)]
+        out.append(annotation_samples[0].concatenate(*annotation_samples[1:]))
+    return out
+
+def _rasterize_polyline(vertices: "np.ndarray[Any, np.dtype[np.int64]]") -> "np.ndarray[Any, np.dtype[np.int64]]":
+    """Coordinates of all points on the straight segments joining consecutive rows of vertices, computed
+    for all segments at once instead of one interpolated voxel at a time. Points are the same as the ones from
+    Point5D.interpolate_until, which steps by delta/steps; delta*(i/steps) would round differently at .5"""
+    starts = vertices[:-1]
+    deltas = vertices[1:] - starts
+    num_steps = np.abs(deltas).max(axis=1, initial=0)
+    increments = deltas / np.maximum(num_steps, 1)[:, np.newaxis]
+    segment_indices = np.repeat(np.arange(len(starts)), num_steps)
+    step_indices = np.arange(segment_indices.size) - np.repeat(np.cumsum(num_steps) - num_steps, num_steps)
+    points = np.around(starts[segment_indices] + increments[segment_indices] * step_indices[:, np.newaxis]).astype(np.int64)
+    return np.concatenate([points, vertices[-1:]])
 
 class Annotation(ScalarData):
     """User annotation attached to the raw data onto which they were drawn"""
 
     def __hash__(self):
-        return hash(self._data.tobytes())
+        if self._hash is None:
+            # hash the array's buffer directly instead of materializing a copy via tobytes()
+            digest = hashlib.blake2b(np.ascontiguousarray(self._data).data, digest_size=8).digest()
+            self._hash = int.from_bytes(digest, byteorder="little")
+        return self._hash
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Annotation) or self.interval != other.interval:
@@ -117,6 +198,7 @@ class Annotation(ScalarData):
         if not raw_data.interval.contains(self.interval):
             raise AnnotationOutOfBounds(annotation_roi=self.interval, raw_data=raw_data)
         self.raw_data = raw_data
+        self._hash: "int | None" = None
 
     def rebuild(self, arr: "np.ndarray[Any, Any]", *, axiskeys: str, location: "Point5D | None" = None) -> "Annotation":
         location = self.location if location is None else location
@@ -129,13 +211,11 @@ class Annotation(ScalarData):
         scribbling_roi = Interval5D.create_from_start_stop(start=start, stop=stop)
         if scribbling_roi.shape.c != 1:
             raise ValueError(f"Annotations must not span multiple channels: {voxels}")
-        scribblings = Array5D.allocate(scribbling_roi, dtype=np.dtype(bool), value=False)
+        scribblings = Array5D.allocate(scribbling_roi, dtype=np.dtype(bool), value=False, axiskeys="tzyxc")
 
-        anchor = voxels[0]
-        for voxel in voxels:
-            for interp_voxel in anchor.interpolate_until(voxel):
-                scribblings.paint_point(point=interp_voxel, value=True)
-            anchor = voxel
+        vertices = np.asarray([voxel.to_tuple("tzyxc") for voxel in voxels], dtype=np.int64)
+        line_points = _rasterize_polyline(vertices) - np.asarray(start.to_tuple("tzyxc"), dtype=np.int64)
+        scribblings.raw("tzyxc")[tuple(line_points.T)] = True
 
         return cls(scribblings._data, axiskeys=scribblings.axiskeys, raw_data=raw_data, location=start)
 
@@ -146,6 +226,7 @@ class Annotation(ScalarData):
         mask = annotation.cut(intersection_interval).as_mask()
         raw_mask = mask.raw(self.axiskeys)
         self.cut(intersection_interval).raw(self.axiskeys)[raw_mask] = False
+        self._hash = None
 
     def is_blank(self) -> bool:
         return not np.any(self._data)
@@ -203,18 +284,7 @@ class Annotation(ScalarData):
             yield Point5D(x=x, y=y, z=z) + self.location
 
     def get_feature_samples(self, feature_extractor: FeatureExtractor) -> FeatureSamples:
-        interval_under_annotation = self.interval.updated(c=self.raw_data.interval.c)
-
-        tile_shape = self.raw_data.tile_shape.updated(c=self.raw_data.shape.c)
-        make_samples_on_tile = partial(_make_samples, annotation=self, feature_extractor=feature_extractor)
-        num_tiles = interval_under_annotation.get_num_tiles(tile_shape=tile_shape)
-        executor = get_executor(hint="sampling", max_workers=num_tiles)
-        all_feature_samples = list(executor.map(
-            make_samples_on_tile,
-            self.raw_data.roi.clamped(interval_under_annotation).get_tiles(tile_shape=tile_shape, tiles_origin=self.raw_data.location)
-        ))
-
-        return all_feature_samples[0].concatenate(*all_feature_samples[1:])
+        return get_feature_samples([self], feature_extractor)[0]
 
     def colored(self, value: np.uint8) -> Array5D:
         return Array5D(self._data * value, axiskeys=self.axiskeys, location=self.location)
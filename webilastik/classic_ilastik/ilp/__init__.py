@@ -212,7 +212,9 @@ def populate_h5_group(group: h5py.Group, data: IlpGroup) -> None:
             h5_value = value
 
         if isinstance(h5_value, np.ndarray):
-            dataset = group.create_dataset(key, data=h5_value, compression="gzip")
+            # fast gzip level + byte shuffle: much cheaper to encode than the default level while staying
+            # readable by any hdf5 install (and therefore by classic ilastik) without extra filter plugins
+            dataset = group.create_dataset(key, data=h5_value, compression="gzip", compression_opts=1, shuffle=True)
         else:
             dataset = group.create_dataset(key, data=h5_value)
 
@@ -14,7 +14,7 @@ import vigra
 from numpy import ndarray, dtype, int64
 from vigra.vigranumpycore import AxisTags
 from ndstructs.array5D import Array5D
-from ndstructs.point5D import Interval5D, Shape5D
+from ndstructs.point5D import Interval5D, Point5D, Shape5D
 from vigra.learning import RandomForest as VigraRandomForest
 
 from webilastik.annotations.annotation import Color
@@ -179,7 +179,9 @@ class IlpPixelClassificationGroup:
                 ):
                     annotation_tile = annotation.cut(interval.clamped(annotation.interval))
                     tile = merged_tiles.setdefault(interval, Array5D.allocate(interval=interval, value=0, dtype=np.dtype("uint8")))
-                    tile.set(annotation_tile.colored(np.uint8(label_class)), mask_value=0)
+                    # write through a view of the tile instead of allocating a colored copy of the annotation
+                    tile_view = tile.cut(annotation_tile.interval).raw(Point5D.LABELS)
+                    tile_view[annotation_tile.raw(Point5D.LABELS)] = np.uint8(label_class)
 
         LabelSets = group.create_group("LabelSets")
         for lane_index, (lane_datasource, blocks) in enumerate(merged_annotation_tiles.items()):
@@ -1,11 +1,13 @@
 from abc import abstractmethod
+from collections import OrderedDict
 from functools import partial
 from pathlib import Path
-from typing import Any, Final, Iterator, List, Generic, NewType, Sequence, TypeVar
+from typing import Any, Final, Iterator, List, Generic, Literal, NewType, Sequence, TypeVar
 import tempfile
+import threading
+import uuid
 import os
 import typing
-import PIL # pyright: ignore [reportMissingTypeStubs]
 import io
 from dataclasses import dataclass
 
@@ -17,7 +19,7 @@ from ndstructs.array5D import Array5D
 from ndstructs.point5D import Interval5D, Shape5D
 from webilastik.features.feature_extractor import FeatureExtractor
 from webilastik.features.feature_extractor import FeatureExtractorCollection
-from webilastik.annotations import Annotation, Color
+from webilastik.annotations import Annotation, Color, get_feature_samples
 from webilastik.operator import Operator
 from webilastik.datasource import DataRoi, DataSource
 from executor_getter import get_executor
@@ -27,24 +29,37 @@ class Predictions(Array5D):
     how likely that pixel is to belong to the classification class associated with
     that channel"""
 
-    def to_z_slice_pngs(self, class_colors: Sequence[Color]) -> Iterator[io.BytesIO]:
-        for z_slice in self.split(self.shape.updated(z=1)):
-            print(f"\nz_slice: {z_slice}")
-            rendered_rgb = Array5D.allocate(z_slice.shape.updated(c=3), dtype=np.dtype("float32"), value=0)
-            rendered_rgb_yxc = rendered_rgb.raw("yxc")
-
-            for prediction_channel, color in zip(z_slice.split(z_slice.shape.updated(c=1)), class_colors):
-                print(f"\nprediction_channel: {prediction_channel}")
+    def as_uint8(self, normalized: bool = True) -> Array5D:
+        """Quantizes straight into a uint8, channels-first buffer, without a float temporary of the whole array.
 
-                class_rgb = Array5D(np.ones(prediction_channel.shape.updated(c=3).to_tuple("yxc")), axiskeys="yxc")
-                class_rgb.raw("yxc")[...] *= np.asarray([color.r, color.g, color.b])
-                class_rgb.raw("cyx")[...] *= prediction_channel.raw("yx")
+        With channels outermost, raw("xyzc") of the result is already in the Fortran order of neuroglancer's raw chunks"""
+        out: "ndarray[Any, dtype[np.uint8]]" = np.empty(self.shape.to_tuple("tczyx"), dtype=np.uint8)
+        _ = np.multiply(self.raw("tczyx"), 255 if normalized else 1, out=out, casting="unsafe")
+        return Array5D(out, axiskeys="tczyx", location=self.location)
 
-                rendered_rgb_yxc += class_rgb.raw("yxc")
-
-            out_image = PIL.Image.fromarray(rendered_rgb.raw("yxc").astype(np.uint8)) # type: ignore
+    def to_z_slice_pngs(self, class_colors: Sequence[Color]) -> Iterator[io.BytesIO]:
+        return self.to_z_slice_images(class_colors, image_format="png")
+
+    def to_z_slice_images(
+        self, class_colors: Sequence[Color], *, image_format: 'Literal["png", "jpeg"]'
+    ) -> Iterator[io.BytesIO]:
+        # only the server-side rendering of tiles needs PIL, so it's not loaded with every worker that imports this module
+        from PIL import Image as PilImage # pyright: ignore [reportMissingTypeStubs]
+
+        num_channels = min(self.shape.c, len(class_colors))
+        # (num_channels, 3) matrix, so that the rgb of each pixel is its channels' probabilities weighing the class colors
+        class_rgbs: "ndarray[Any, dtype[float32]]" = np.asarray(
+            [[color.r, color.g, color.b] for color in class_colors[:num_channels]], dtype=np.float32
+        )
+        for z_slice in self.split(self.shape.updated(z=1)):
+            rendered_rgb_yxc = z_slice.raw("yxc")[..., :num_channels] @ class_rgbs
+            out_image = PilImage.fromarray(rendered_rgb_yxc.astype(np.uint8)) # type: ignore
             out_file = io.BytesIO()
-            out_image.save(out_file, "png")
+            if image_format == "jpeg":
+                # much cheaper to encode than png, and prediction overlays don't need to be lossless
+                out_image.save(out_file, "jpeg", quality=85)
+            else:
+                out_image.save(out_file, "png")
             _ = out_file.seek(0)
             yield out_file
 
@@ -81,15 +96,18 @@ class TrainingData:
 
         combined_extractor = FeatureExtractorCollection(feature_extractors)
 
+        all_annotations = [annotation for labels in label_classes for annotation in labels]
+        annotation_labels = [np.uint8(label_index) for label_index, labels in enumerate(label_classes, start=1) for _ in labels]
+        # sampling all annotations together computes each data tile's features only once
+        feature_samples = get_feature_samples(all_annotations, combined_extractor)
+
         X_parts: List["np.ndarray[Any, np.dtype[Any]]"] = []
         y_parts: List["np.ndarray[Any, np.dtype[np.uint32]]"] = []
-        for label_index, labels in enumerate(label_classes, start=1):
-            for annotation in labels:
-                feature_sample = annotation.get_feature_samples(combined_extractor)
-                X_parts.append(feature_sample.X)
-                y_parts.append(
-                    feature_sample.get_y(label_class=np.uint8(label_index))
-                )
+        for feature_sample, label_class in zip(feature_samples, annotation_labels):
+            X_parts.append(feature_sample.X)
+            y_parts.append(
+                feature_sample.get_y(label_class=label_class)
+            )
 
         feature_extractors = feature_extractors
         combined_extractor = combined_extractor
@@ -120,6 +138,8 @@ class PixelClassifier(Operator[DataRoi, Predictions], Generic[FE]):
         self.num_classes = num_classes
         self.classes: Sequence[np.uint8] = [np.uint8(class_index + 1) for class_index in range(num_classes)]
         self.num_input_channels = num_input_channels
+        # unique to this instance (and not shared by its unpickled copies), to refer to it across processes
+        self.instance_id: Final[str] = uuid.uuid4().hex
         super().__init__()
 
     @abstractmethod
@@ -235,37 +255,52 @@ class VigraPixelClassifier(PixelClassifier[FE]):
 
 
     def _do_predict(self, roi: DataRoi) -> Predictions:
-        feature_data = self.feature_extractor(roi)
-        linear_feature_data = feature_data.raw("tzyxc").reshape(
-            (feature_data.shape.t * feature_data.shape.volume, feature_data.shape.c)
+        return self._do_predict_batch([roi])[0]
+
+    def predict_batch(self, rois: Sequence[DataRoi]) -> List[Predictions]:
+        """Predicts on multiple rois with a single pass of each forest over the samples of all rois,
+        which amortizes the per-call overhead of the forests when rois are small"""
+        for roi in rois:
+            self.feature_extractor.ensure_applicable(roi.datasource)
+            if roi.shape.c != self.num_input_channels:
+                raise ValueError(f"Bad roi: {roi}. Expected roi to have shape.c={self.num_input_channels}")
+        return self._do_predict_batch(rois)
+
+    def _do_predict_batch(self, rois: Sequence[DataRoi]) -> List[Predictions]:
+        linear_feature_parts: List["ndarray[Any, dtype[float32]]"] = []
+        for roi in rois:
+            feature_data = self.feature_extractor(roi)
+            linear_feature_parts.append(feature_data.raw("tzyxc").reshape(
+                (feature_data.shape.t * feature_data.shape.volume, feature_data.shape.c)
+            ))
+        linear_feature_data = linear_feature_parts[0] if len(rois) == 1 else np.concatenate(linear_feature_parts)
+
+        raw_linear_predictions: "ndarray[Any, dtype[float32]]" = np.zeros(
+            (linear_feature_data.shape[0], self.num_classes), dtype=np.float32
         )
-
-        predictions = Array5D.allocate(
-            axiskeys="tzyxc",
-            interval=self.get_expected_roi(roi),
-            dtype=np.dtype('float32'),
-            value=0,
-        )
-
-        assert predictions.interval == self.get_expected_roi(roi)
-        raw_linear_predictions: "ndarray[Any, dtype[float32]]" = predictions.raw("tzyxc").reshape(
-            (predictions.shape.t * predictions.shape.volume, predictions.shape.c)
-        )
-
         executor = get_executor(hint="predicting")
         f = partial(_compute_partial_predictions, linear_feature_data)
         futures = [executor.submit(f, forest) for forest in self.forests]
         for partial_predictions_future in futures:
             raw_linear_predictions += partial_predictions_future.result()
-
         raw_linear_predictions /= self.num_trees
-        predictions.setflags(write=False)
 
-        return Predictions(
-            arr=predictions.raw(predictions.axiskeys),
-            axiskeys=predictions.axiskeys,
-            location=predictions.location,
-        )
+        out: List[Predictions] = []
+        sample_offset = 0
+        for roi, feature_part in zip(rois, linear_feature_parts):
+            num_samples = feature_part.shape[0]
+            expected_roi = self.get_expected_roi(roi)
+            predictions = Predictions(
+                arr=raw_linear_predictions[sample_offset:sample_offset + num_samples].reshape(
+                    expected_roi.shape.to_tuple("tzyxc")
+                ),
+                axiskeys="tzyxc",
+                location=expected_roi.start,
+            )
+            predictions.setflags(write=False)
+            out.append(predictions)
+            sample_offset += num_samples
+        return out
 
     def __getstate__(self):
         return {
@@ -284,3 +319,32 @@ class VigraPixelClassifier(PixelClassifier[FE]):
             num_classes=data["num_classes"],
             minInputShape=data["minInputShape"],
         )
+
+
+class ClassifierNotCached:
+    pass
+
+_cached_classifiers: "OrderedDict[str, PixelClassifier[Any]]" = OrderedDict()
+_cached_classifiers_lock = threading.Lock()
+_MAX_CACHED_CLASSIFIERS = 4
+
+def predict_with_cached_classifier(
+    classifier_key: str, roi: DataRoi, classifier: "PixelClassifier[Any] | None" = None
+) -> "Predictions | ClassifierNotCached":
+    """Predicts on roi with the classifier cached under classifier_key in the current process, caching
+    classifier first if it is given.
+
+    When the executor runs its tasks in other processes, shipping a classifier (and all of its forests) with
+    every tile dominates the cost of predicting on small rois. So callers submit this without the classifier
+    at first, and send it along only to workers that answer with ClassifierNotCached"""
+    with _cached_classifiers_lock:
+        if classifier is None:
+            classifier = _cached_classifiers.get(classifier_key)
+            if classifier is None:
+                return ClassifierNotCached()
+        else:
+            _cached_classifiers[classifier_key] = classifier
+        _cached_classifiers.move_to_end(classifier_key)
+        while len(_cached_classifiers) > _MAX_CACHED_CLASSIFIERS:
+            _ = _cached_classifiers.popitem(last=False)
+    return classifier(roi)
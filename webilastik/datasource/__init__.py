@@ -135,9 +135,18 @@ class DataRoi(Interval5D):
             z=z if z is not None else datasource.interval.z,
         )
         self.datasource = datasource
+        self._hash: Optional[int] = None
 
     def __hash__(self) -> int:
-        return hash((super().__hash__(), self.datasource))
+        # rois are cache keys for every feature extractor, and hashing the datasource can be expensive (e.g. building
+        # its url), so this is only done once per roi
+        if self._hash is None:
+            self._hash = hash((super().__hash__(), self.datasource))
+        return self._hash
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # string hashes are different in every process, so the cached hash must not be pickled
+        return {**self.__dict__, "_hash": None}
 
     def __eq__(self, other: object) -> bool:
         if not super().__eq__(other):
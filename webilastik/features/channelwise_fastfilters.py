@@ -1,6 +1,10 @@
 from abc import abstractmethod
-from typing import Any, Literal, Optional, TypeVar, Type, List
-import fastfilters #type: ignore
+from typing import Any, Literal, Mapping, Optional, TypeVar, Type, List
+try:
+    import fastfilters #type: ignore
+except ImportError:
+    # fastfilters is a compiled dependency that is not available everywhere; fall back to scipy.ndimage
+    from webilastik.features import ndimage_filters as fastfilters
 import math
 
 import numpy
@@ -16,6 +20,9 @@ from global_cache import global_cache
 
 Axis2D = Literal["x", "y", "z"]
 
+# spatial axes of the arrays handed to fastfilters, depending on which axis (if any) is sliced over
+SOURCE_AXES: Mapping[Optional[Axis2D], str] = {None: "zyx", "x": "zy", "y": "zx", "z": "yx"}
+
 def get_axis_2d(data: JsonValue) -> Optional[Axis2D]:
     axis_2d = ensureJsonString(data)
     if len(axis_2d) != 1 or axis_2d not in ("x", "y", "z"):
@@ -24,6 +31,11 @@ def get_axis_2d(data: JsonValue) -> Optional[Axis2D]:
 
 
 WINDOW_SIZE = 3.5
+# how many sigmas away from a pixel to look for input when window_size is left at 0 (i.e. fastfilters' default)
+HALO_WINDOW_SIZE = 4.0
+
+def get_kernel_radius(sigma: float, window_size: float) -> int:
+    return math.ceil(sigma * (window_size or HALO_WINDOW_SIZE)) + 1
 
 class PresmoothedFilter(FeatureExtractor):
     def __init__(
@@ -34,6 +46,8 @@ class PresmoothedFilter(FeatureExtractor):
         preprocessor: Operator[DataRoi, Array5D] = OpRetriever(axiskeys_hint="ctzyx"),
     ):
         self.ilp_scale = ilp_scale
+        # filters of the same scale all request the presmoothed data with this halo, so it's computed only once
+        self.presmoothed_halo_radius = self.get_presmoothed_halo_radius(ilp_scale)
         self.presmoother = GaussianSmoothing(
             preprocessor=preprocessor,
             axis_2d=axis_2d,
@@ -44,16 +58,27 @@ class PresmoothedFilter(FeatureExtractor):
         self.axis_2d: Optional[Axis2D] = axis_2d
         super().__init__()
 
+    @staticmethod
+    def get_presmoothed_halo_radius(ilp_scale: float) -> int:
+        """The largest kernel radius of the filters applied to presmoothed data of this scale, which is the
+        structure tensor's (inner scale plus outer scale of half of it)"""
+        capped_scale = min(ilp_scale, 1.0)
+        return get_kernel_radius(capped_scale, 0) + get_kernel_radius(0.5 * capped_scale, 0)
+
 class ChannelwiseFastFilter(JsonableFeatureExtractor):
     def __init__(
         self,
         *,
         preprocessor: Operator[DataRoi, Array5D] = OpRetriever(axiskeys_hint="ctzyx"),
         axis_2d: Optional[Axis2D],
+        min_halo_radius: int = 0,
     ):
         super().__init__()
         self.preprocessor = preprocessor
-        self.axis_2d=axis_2d
+        self.axis_2d: Optional[Axis2D] = axis_2d
+        # enlarges the halo beyond the kernel's, so that filters of different radii can request the exact same
+        # roi from a shared (cached) preprocessor
+        self.min_halo_radius = min_halo_radius
 
     def to_json_value(self) -> JsonObject:
         return {
@@ -71,13 +96,19 @@ class ChannelwiseFastFilter(JsonableFeatureExtractor):
         pass
 
     def __repr__(self):
-        props = " ".join(f"{k}={v}" for k, v in self.__dict__.items())
+        props = " ".join(f"{k}={v}" for k, v in self._identity())
         return f"<{self.__class__.__name__} {props}>"
 
+    @property
+    @abstractmethod
+    def kernel_radius(self) -> int:
+        """How far from an output pixel (in pixels) the input data can still influence its value"""
+        pass
+
     @property
     def halo(self) -> Point5D:
-        # FIXME: Add appropriate halo property to filters
-        args = {"x": 30, "y": 30, "z": 30, "c": 0}
+        radius = max(self.kernel_radius, self.min_halo_radius)
+        args = {"x": radius, "y": radius, "z": radius, "c": 0}
         if self.axis_2d:
             args[self.axis_2d] = 0
         return Point5D(**args)
@@ -90,36 +121,54 @@ class ChannelwiseFastFilter(JsonableFeatureExtractor):
         haloed_roi = roi.enlarged(self.halo)
         source_data = self.preprocessor(haloed_roi)
 
-        step_shape: Shape5D = Shape5D(
-            c=1,
-            t=1,
-            x= 1 if self.axis_2d == "x" else source_data.shape.x,
-            y= 1 if self.axis_2d == "y" else source_data.shape.y,
-            z= 1 if self.axis_2d == "z" else source_data.shape.z,
-        )
-
         out = Array5D.allocate(
             interval=roi.updated(
                 c=(roi.c[0] * self.channel_multiplier, roi.c[1] * self.channel_multiplier)
             ),
             dtype=numpy.dtype("float32"),
-            axiskeys=source_data.axiskeys.replace("c", "") + "c" # fastfilters puts channel last
+            axiskeys="tzyxc" # fastfilters puts channel last
         )
 
-        for data_slice in source_data.split(step_shape):
-            source_axes = "zyx"
-            if self.axis_2d:
-                source_axes = source_axes.replace(self.axis_2d, "")
-
-            raw_data: "ndarray[Any, dtype[float32]]" = data_slice.raw(source_axes).astype(numpy.float32)
-            raw_feature_data: "ndarray[Any, dtype[float32]]" = self.filter_fn(raw_data)
-
-            feature_data = FeatureData(
-                raw_feature_data,
-                axiskeys=source_axes + "c" if len(raw_feature_data.shape) > len(source_axes) else source_axes,
-                location=data_slice.location.updated(c=data_slice.location.c * self.channel_multiplier)
-            )
-            out.set(feature_data, autocrop=True)
+        source_axes = SOURCE_AXES[self.axis_2d]
+        # iterate over plain numpy views of the source data instead of splitting it into an Array5D per channel/slice
+        source_raw: "ndarray[Any, Any]" = source_data.raw("tczyx")
+        location = source_data.location
+        # features are written straight into views of 'out', with the halo cropped off by indexing
+        out_raw: "ndarray[Any, dtype[float32]]" = out.raw("tzyxc")
+        halo_start = roi.start - location
+        halo_crop = tuple(
+            slice(getattr(halo_start, axis), getattr(halo_start, axis) + getattr(roi.shape, axis)) for axis in source_axes
+        )
+        channel_multiplier = self.channel_multiplier
+        # (source index, out index) pairs over the spatial axes for every slice that is filtered individually.
+        # These are the same for every t and c, so they are computed only once
+        if self.axis_2d:
+            axis_2d = self.axis_2d
+            axis_2d_offset: int = getattr(halo_start, axis_2d)
+            slicings = [
+                (
+                    tuple(i if axis == axis_2d else slice(None) for axis in "zyx"),
+                    tuple(i - axis_2d_offset if axis == axis_2d else slice(None) for axis in "zyx"),
+                )
+                for i in range(source_raw.shape[2 + "zyx".index(axis_2d)])
+            ]
+        else:
+            full_volume = (slice(None), slice(None), slice(None))
+            slicings = [(full_volume, full_volume)]
+
+        for t, c in numpy.ndindex(*source_raw.shape[:2]):
+            out_t = location.t + t - roi.start.t
+            out_c = (location.c + c - roi.start.c) * channel_multiplier
+            out_channels = slice(out_c, out_c + channel_multiplier)
+            for source_index, out_index in slicings:
+                # no copy if the preprocessor already produced contiguous float32 data (e.g. a presmoother)
+                raw_data: "ndarray[Any, dtype[float32]]" = numpy.ascontiguousarray(
+                    source_raw[(t, c, *source_index)], dtype=numpy.float32
+                )
+                raw_feature_data: "ndarray[Any, dtype[float32]]" = self.filter_fn(raw_data)
+                if len(raw_feature_data.shape) == len(source_axes):
+                    raw_feature_data = raw_feature_data[..., numpy.newaxis]
+                out_raw[(out_t, *out_index, out_channels)] = raw_feature_data[halo_crop]
         out.setflags(write=False)
         return FeatureData(
             out.raw(out.axiskeys),
@@ -137,8 +186,9 @@ class StructureTensorEigenvalues(ChannelwiseFastFilter):
         outerScale: float,
         window_size: float = 0,
         axis_2d: Optional[Axis2D],
+        min_halo_radius: int = 0,
     ):
-        super().__init__(preprocessor=preprocessor, axis_2d=axis_2d)
+        super().__init__(preprocessor=preprocessor, axis_2d=axis_2d, min_halo_radius=min_halo_radius)
         self.innerScale = innerScale
         self.outerScale = outerScale
         self.window_size = window_size
@@ -170,6 +220,11 @@ class StructureTensorEigenvalues(ChannelwiseFastFilter):
     def channel_multiplier(self) -> int:
         return 2 if self.axis_2d else 3
 
+    @property
+    def kernel_radius(self) -> int:
+        # gradients at innerScale are smoothed again at outerScale
+        return get_kernel_radius(self.innerScale, self.window_size) + get_kernel_radius(self.outerScale, self.window_size)
+
     @classmethod
     def from_ilp_scale(
         cls, *, preprocessor: Operator[DataRoi, Array5D] = OpRetriever(axiskeys_hint="ctzyx"), scale: float, axis_2d: Optional[Axis2D]
@@ -194,8 +249,9 @@ class SigmaWindowFilter(ChannelwiseFastFilter):
         sigma: float,
         window_size: float = 0,
         axis_2d: Optional[Axis2D],
+        min_halo_radius: int = 0,
     ):
-        super().__init__(preprocessor=preprocessor, axis_2d=axis_2d)
+        super().__init__(preprocessor=preprocessor, axis_2d=axis_2d, min_halo_radius=min_halo_radius)
         self.sigma = sigma
         self.window_size = window_size
 
@@ -215,6 +271,10 @@ class SigmaWindowFilter(ChannelwiseFastFilter):
             "window_size": self.window_size,
         }
 
+    @property
+    def kernel_radius(self) -> int:
+        return get_kernel_radius(self.sigma, self.window_size)
+
     @classmethod
     def from_ilp_scale(
         cls: Type[SIGMA_FILTER],
@@ -256,8 +316,9 @@ class DifferenceOfGaussians(ChannelwiseFastFilter):
         sigma1: float,
         window_size: float = 0,
         axis_2d: Optional[Axis2D],
+        min_halo_radius: int = 0,
     ):
-        super().__init__(preprocessor=preprocessor, axis_2d=axis_2d)
+        super().__init__(preprocessor=preprocessor, axis_2d=axis_2d, min_halo_radius=min_halo_radius)
         self.sigma0 = sigma0
         self.sigma1 = sigma1
         self.window_size = window_size
@@ -266,6 +327,10 @@ class DifferenceOfGaussians(ChannelwiseFastFilter):
     def channel_multiplier(self) -> int:
         return 1
 
+    @property
+    def kernel_radius(self) -> int:
+        return get_kernel_radius(max(self.sigma0, self.sigma1), self.window_size)
+
     @classmethod
     def from_json_value(cls, data: JsonValue) -> "DifferenceOfGaussians":
         data_dict = ensureJsonObject(data)
@@ -288,9 +353,10 @@ class DifferenceOfGaussians(ChannelwiseFastFilter):
         return f"<{self.__class__.__name__} sigma0:{self.sigma0} sigma1:{self.sigma1} window_size:{self.window_size} axis_2d:{self.axis_2d}>"
 
     def filter_fn(self, source_raw: "ndarray[Any, dtype[float32]]") -> "ndarray[Any, dtype[float32]]":
-        a = fastfilters.gaussianSmoothing(source_raw, sigma=self.sigma0, window_size=self.window_size)
-        b = fastfilters.gaussianSmoothing(source_raw, sigma=self.sigma1, window_size=self.window_size)
-        return a - b
+        a: "ndarray[Any, dtype[float32]]" = fastfilters.gaussianSmoothing(source_raw, sigma=self.sigma0, window_size=self.window_size)
+        b: "ndarray[Any, dtype[float32]]" = fastfilters.gaussianSmoothing(source_raw, sigma=self.sigma1, window_size=self.window_size)
+        # subtract in place so that we don't allocate (and stream through) a third full volume
+        return numpy.subtract(a, b, out=a)
 
 
 ScaleFilter = TypeVar("ScaleFilter", bound="ScaleWindowFilter")
@@ -304,8 +370,9 @@ class ScaleWindowFilter(ChannelwiseFastFilter):
         scale: float,
         window_size: float = 0,
         axis_2d: Optional[Axis2D],
+        min_halo_radius: int = 0,
     ):
-        super().__init__(preprocessor=preprocessor, axis_2d=axis_2d)
+        super().__init__(preprocessor=preprocessor, axis_2d=axis_2d, min_halo_radius=min_halo_radius)
         self.scale = scale
         self.window_size = window_size
 
@@ -325,6 +392,10 @@ class ScaleWindowFilter(ChannelwiseFastFilter):
             "window_size": self.window_size,
         }
 
+    @property
+    def kernel_radius(self) -> int:
+        return get_kernel_radius(self.scale, self.window_size)
+
 
 class HessianOfGaussianEigenvalues(ScaleWindowFilter):
     def filter_fn(self, source_raw: "ndarray[Any, dtype[float32]]") -> "ndarray[Any, dtype[float32]]":
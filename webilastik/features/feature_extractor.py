@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import Any, Dict, Iterable, Protocol
+from typing import Any, Dict, Iterable, Protocol, Tuple
 from concurrent.futures import Future
 
 import numpy as np
@@ -37,11 +37,26 @@ class FeatureExtractor(Operator[DataRoi, FeatureData], Protocol):
         if not self.is_applicable_to(datasource):
             raise FeatureDataMismatchException(self, datasource)
 
+    def _identity(self) -> Tuple[Any, ...]:
+        return tuple((k, v) for k, v in self.__dict__.items() if k != "_hash")
+
     def __hash__(self):
-        return hash((self.__class__, tuple(self.__dict__.values())))
+        # extractors are immutable by convention, so the hash of their (possibly nested) attributes can be cached.
+        # The cached value is not pickled (see __getstate__) since string hashes differ between processes
+        cached_hash: "int | None" = self.__dict__.get("_hash")
+        if cached_hash is None:
+            cached_hash = self.__dict__["_hash"] = hash((self.__class__, self._identity()))
+        return cached_hash
 
     def __eq__(self, other):
-        return self.__class__ == other.__class__ and self.__dict__ == other.__dict__
+        if self is other:
+            return True
+        if self.__class__ != other.__class__ or hash(self) != hash(other):
+            return False
+        return self._identity() == other._identity()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {k: v for k, v in self.__dict__.items() if k != "_hash"}
 
 
 class FeatureExtractorCollection(FeatureExtractor):
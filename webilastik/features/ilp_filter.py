@@ -134,6 +134,7 @@ class IlpGaussianSmoothing(IlpFilter):
         super().__init__(ilp_scale=ilp_scale, axis_2d=axis_2d, preprocessor=preprocessor)
         self._op = GaussianSmoothing(
             preprocessor=self.presmoother,
+            min_halo_radius=self.presmoothed_halo_radius,
             sigma=min(ilp_scale, 1.0),
             axis_2d=axis_2d,
         )
@@ -157,6 +158,7 @@ class IlpLaplacianOfGaussian(IlpFilter):
         super().__init__(ilp_scale=ilp_scale, axis_2d=axis_2d, preprocessor=preprocessor)
         self._op = LaplacianOfGaussian(
             preprocessor=self.presmoother,
+            min_halo_radius=self.presmoothed_halo_radius,
             scale=min(ilp_scale, 1.0),
             axis_2d=axis_2d,
         )
@@ -180,6 +182,7 @@ class IlpGaussianGradientMagnitude(IlpFilter):
         super().__init__(ilp_scale=ilp_scale, axis_2d=axis_2d, preprocessor=preprocessor)
         self._op = GaussianGradientMagnitude(
             preprocessor=self.presmoother,
+            min_halo_radius=self.presmoothed_halo_radius,
             sigma=min(ilp_scale, 1.0),
             axis_2d=axis_2d,
         )
@@ -204,6 +207,7 @@ class IlpDifferenceOfGaussians(IlpFilter):
         capped_scale = min(ilp_scale, 1.0)
         self._op = DifferenceOfGaussians(
             preprocessor=self.presmoother,
+            min_halo_radius=self.presmoothed_halo_radius,
             sigma0=capped_scale,
             sigma1=capped_scale * 0.66,
             axis_2d=axis_2d,
@@ -232,6 +236,7 @@ class IlpStructureTensorEigenvalues(IlpFilter):
             outerScale=0.5 * capped_scale,
             axis_2d=axis_2d,
             preprocessor=self.presmoother,
+            min_halo_radius=self.presmoothed_halo_radius,
         )
 
     @classmethod
@@ -251,6 +256,7 @@ class IlpHessianOfGaussianEigenvalues(IlpFilter):
         super().__init__(ilp_scale=ilp_scale, axis_2d=axis_2d)
         self._op = HessianOfGaussianEigenvalues(
             preprocessor=self.presmoother,
+            min_halo_radius=self.presmoothed_halo_radius,
             scale=min(ilp_scale, 1.0),
             axis_2d=axis_2d,
         )
@@ -0,0 +1,113 @@
+"""Drop-in replacements for the fastfilters functions used by webilastik, implemented on top of scipy.ndimage.
+
+These are only used when fastfilters can't be imported; they take the same (2D or 3D, single channel, float32)
+arrays and produce the same output layout, i.e. multi-channel results (like eigenvalues) have channels last and
+eigenvalues are sorted in descending order.
+"""
+
+from typing import Any, List
+
+import numpy
+from numpy import ndarray, dtype, float32
+from scipy import ndimage # pyright: ignore [reportMissingTypeStubs]
+
+DEFAULT_WINDOW_SIZE = 3.0
+
+def _truncate(window_size: float) -> float:
+    return window_size or DEFAULT_WINDOW_SIZE
+
+def _derivative(
+    source_raw: "ndarray[Any, dtype[float32]]", *, sigma: float, window_size: float, orders: List[int]
+) -> "ndarray[Any, dtype[float32]]":
+    return ndimage.gaussian_filter(
+        source_raw, sigma=sigma, order=orders, truncate=_truncate(window_size), output=numpy.float32
+    )
+
+def _gradient(
+    source_raw: "ndarray[Any, dtype[float32]]", *, sigma: float, window_size: float
+) -> "List[ndarray[Any, dtype[float32]]]":
+    return [
+        _derivative(
+            source_raw,
+            sigma=sigma,
+            window_size=window_size,
+            orders=[1 if axis == derivative_axis else 0 for axis in range(source_raw.ndim)],
+        )
+        for derivative_axis in range(source_raw.ndim)
+    ]
+
+def symmetric_eigenvalues(
+    components: "List[List[ndarray[Any, dtype[float32]]]]"
+) -> "ndarray[Any, dtype[float32]]":
+    """Eigenvalues, in descending order and along a new last axis, of the symmetric 2x2 or 3x3 matrices whose
+    upper triangle is given by components[row][col - row].
+
+    Uses the closed-form solutions instead of a generic per-voxel eigensolver, which would first have to
+    gather all components into an array of small matrices."""
+    if len(components) == 2:
+        [[xx, xy], [yy]] = components
+        half_trace = (xx + yy) / 2
+        radius = numpy.sqrt(((xx - yy) / 2) ** 2 + xy * xy)
+        return numpy.stack([half_trace + radius, half_trace - radius], axis=-1)
+
+    # Smith, "Eigenvalues of a symmetric 3x3 matrix" (1961)
+    [[xx, xy, xz], [yy, yz], [zz]] = components
+    q = (xx + yy + zz) / 3
+    off_diagonal = xy * xy + xz * xz + yz * yz
+    a, b, c = xx - q, yy - q, zz - q
+    p = numpy.sqrt((a * a + b * b + c * c + 2 * off_diagonal) / 6)
+    safe_p = numpy.where(p == 0, numpy.float32(1), p) # if p == 0 the matrix is q * I and all eigenvalues are q
+    a, b, c, xy, xz, yz = a / safe_p, b / safe_p, c / safe_p, xy / safe_p, xz / safe_p, yz / safe_p
+    half_det = (a * (b * c - yz * yz) - xy * (xy * c - yz * xz) + xz * (xy * yz - b * xz)) / 2
+    phi = numpy.arccos(numpy.clip(half_det, -1, 1)) / 3
+    largest = q + 2 * p * numpy.cos(phi)
+    smallest = q + 2 * p * numpy.cos(phi + 2 * numpy.pi / 3)
+    middle = 3 * q - largest - smallest
+    return numpy.stack([largest, middle, smallest], axis=-1).astype(numpy.float32, copy=False)
+
+def gaussianSmoothing(
+    source_raw: "ndarray[Any, dtype[float32]]", sigma: float, window_size: float = 0
+) -> "ndarray[Any, dtype[float32]]":
+    return ndimage.gaussian_filter(source_raw, sigma=sigma, truncate=_truncate(window_size), output=numpy.float32)
+
+def gaussianGradientMagnitude(
+    source_raw: "ndarray[Any, dtype[float32]]", sigma: float, window_size: float = 0
+) -> "ndarray[Any, dtype[float32]]":
+    gradient = _gradient(source_raw, sigma=sigma, window_size=window_size)
+    return numpy.sqrt(sum(derivative * derivative for derivative in gradient)).astype(numpy.float32, copy=False)
+
+def laplacianOfGaussian(
+    source_raw: "ndarray[Any, dtype[float32]]", scale: float, window_size: float = 0
+) -> "ndarray[Any, dtype[float32]]":
+    return ndimage.gaussian_laplace(source_raw, sigma=scale, truncate=_truncate(window_size), output=numpy.float32)
+
+def hessianOfGaussianEigenvalues(
+    source_raw: "ndarray[Any, dtype[float32]]", scale: float, window_size: float = 0
+) -> "ndarray[Any, dtype[float32]]":
+    ndim = source_raw.ndim
+    components = [
+        [
+            _derivative(
+                source_raw,
+                sigma=scale,
+                window_size=window_size,
+                orders=[int(axis == row) + int(axis == col) for axis in range(ndim)],
+            )
+            for col in range(row, ndim)
+        ]
+        for row in range(ndim)
+    ]
+    return symmetric_eigenvalues(components)
+
+def structureTensorEigenvalues(
+    source_raw: "ndarray[Any, dtype[float32]]", innerScale: float, outerScale: float, window_size: float = 0
+) -> "ndarray[Any, dtype[float32]]":
+    gradient = _gradient(source_raw, sigma=innerScale, window_size=window_size)
+    components = [
+        [
+            gaussianSmoothing(gradient[row] * gradient[col], sigma=outerScale, window_size=window_size)
+            for col in range(row, len(gradient))
+        ]
+        for row in range(len(gradient))
+    ]
+    return symmetric_eigenvalues(components)
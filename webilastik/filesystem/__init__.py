@@ -1,7 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import PurePosixPath
 import typing
-from typing import Sequence, Tuple, List
+from typing import Dict, Sequence, Set, Tuple, List
 
 from webilastik.server.rpc.dto import BucketFSDto, HttpFsDto, OsfsDto, ZipFsDto, FsDto
 from webilastik.utility.url import Url
@@ -85,7 +85,7 @@ class IFilesystem(typing.Protocol):
         listing_result = self.list_contents(path.parent)
         if isinstance(listing_result, Exception):
             return listing_result
-        return path in listing_result.files or path in listing_result.directories
+        return path in listing_result
 
     def transfer_file(self, *, source_fs: "IFilesystem", source_path: PurePosixPath, target_path: PurePosixPath) -> "None | FsIoException | FsFileNotFoundException":
         contents = source_fs.read_file(source_path)
@@ -97,3 +97,13 @@ class IFilesystem(typing.Protocol):
 class FsDirectoryContents:
     files: List[PurePosixPath]
     directories: List[PurePosixPath]
+    # sizes of (some of) the files, for filesystems whose listings come with them at no extra cost
+    file_sizes: Dict[PurePosixPath, int] = field(default_factory=dict)
+    _entries: "Set[PurePosixPath] | None" = field(default=None, init=False, repr=False, compare=False)
+
+    def __contains__(self, path: PurePosixPath) -> bool:
+        """Whether path is one of the files or directories. Listings can be huge, so this uses a set that is
+        built on first use instead of scanning both lists every time"""
+        if self._entries is None:
+            self._entries = {*self.files, *self.directories}
+        return path in self._entries
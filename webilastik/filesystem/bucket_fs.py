@@ -1,16 +1,28 @@
 # pyright: strict
 
 import json
-from typing import Iterator, Literal, Optional, Tuple, List
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Coroutine, Dict, Iterator, Literal, Mapping, Optional, Sequence, Tuple, List, Type, TypeVar
 from pathlib import Path, PurePosixPath
+import asyncio
+import atexit
+import hashlib
+import os
+import threading
 import time
 import re
+import uuid
 
+import aiohttp
 import requests
+import yarl
 from ndstructs.utils.json_serializable import (
+    JsonValue,
     ensureJsonArray,
     ensureJsonObject,
-    ensureJsonString,
 )
 from requests.models import CaseInsensitiveDict
 
@@ -22,88 +34,403 @@ from webilastik.filesystem import (
 )
 from webilastik.filesystem.http_fs import HttpFs
 from webilastik.filesystem.os_fs import OsFs
-from webilastik.serialization.json_serialization import parse_json
+from webilastik.libebrains.user_token import AccessToken
 from webilastik.utility.log import Logger
 from webilastik.utility.url import Url
-from webilastik.server.rpc.dto import BucketFSDto, DataProxyObjectUrlResponse
+from webilastik.server.rpc.dto import BucketFSDto
 from webilastik.utility import Seconds
+if TYPE_CHECKING:
+    from webilastik.libebrains.global_user_login import GlobalLogin
 from webilastik.utility.request import (
+    ErrBadContentLength,
     ErrRequestCompletedAsFailure,
+    make_session,
+    range_headers,
     request_size,
     request as safe_request,
     ErrRequestCrashed,
 )
 
-_cscs_session = requests.Session()
-_data_proxy_session = requests.Session()
+_cscs_session = make_session()
+_data_proxy_session = make_session()
 
 logger = Logger()
 
 
+class _ObjectUrlCache:
+    """Presigned object URLs handed out by the data proxy, kept until shortly before they expire so that
+    repeated reads of the same object don't need a round-trip to the data proxy every time"""
+
+    FALLBACK_TTL: float = 300
+    EXPIRY_MARGIN: float = 30
+    # viewers keep retrying tiles that don't exist, so remember those for a little while too
+    NOT_FOUND_TTL: float = 1
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Url, float]]" = OrderedDict()
+        self._not_found: "OrderedDict[str, float]" = OrderedDict()
+        self._fetch_locks: Dict[str, Tuple[threading.Lock, int]] = {}
+        super().__init__()
+
+    @classmethod
+    def _get_expiry(cls, url: Url) -> float:
+        """Expiry time of a presigned URL, in time.monotonic() terms"""
+        now = time.time()
+        try:
+            if "temp_url_expires" in url.search: # Swift TempURL
+                expires_at = float(url.search["temp_url_expires"])
+            elif "X-Amz-Date" in url.search and "X-Amz-Expires" in url.search: # S3 presigned URL
+                signed_at = datetime.strptime(url.search["X-Amz-Date"], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+                expires_at = signed_at.timestamp() + float(url.search["X-Amz-Expires"])
+            else:
+                expires_at = now + cls.FALLBACK_TTL
+        except ValueError:
+            expires_at = now + cls.FALLBACK_TTL
+        return time.monotonic() + (expires_at - now) - cls.EXPIRY_MARGIN
+
+    def get(self, key: Url) -> "Url | None":
+        with self._lock:
+            entry = self._entries.get(key.raw)
+            if entry is None:
+                return None
+            url, expiry = entry
+            if time.monotonic() >= expiry:
+                del self._entries[key.raw]
+                return None
+            self._entries.move_to_end(key.raw)
+            return url
+
+    def put(self, key: Url, url: Url) -> None:
+        expiry = self._get_expiry(url)
+        with self._lock:
+            self._entries[key.raw] = (url, expiry)
+            self._entries.move_to_end(key.raw)
+            while len(self._entries) > self.max_entries:
+                _ = self._entries.popitem(last=False)
+
+    def is_not_found(self, key: Url) -> bool:
+        with self._lock:
+            expiry = self._not_found.get(key.raw)
+            if expiry is None:
+                return False
+            if time.monotonic() >= expiry:
+                del self._not_found[key.raw]
+                return False
+            return True
+
+    def put_not_found(self, key: Url) -> None:
+        with self._lock:
+            self._not_found[key.raw] = time.monotonic() + self.NOT_FOUND_TTL
+            self._not_found.move_to_end(key.raw)
+            while len(self._not_found) > self.max_entries:
+                _ = self._not_found.popitem(last=False)
+
+    @contextmanager
+    def fetching(self, key: Url) -> Iterator[None]:
+        """Holds a lock specific to key, so that concurrent misses for the same key wait on a single
+        request to the data proxy instead of each making their own"""
+        with self._lock:
+            key_lock, num_users = self._fetch_locks.get(key.raw, (threading.Lock(), 0))
+            self._fetch_locks[key.raw] = (key_lock, num_users + 1)
+        try:
+            with key_lock:
+                yield
+        finally:
+            with self._lock:
+                key_lock, num_users = self._fetch_locks[key.raw]
+                if num_users == 1:
+                    del self._fetch_locks[key.raw]
+                else:
+                    self._fetch_locks[key.raw] = (key_lock, num_users - 1)
+
+    def invalidate(self, key: Url) -> None:
+        """Forgets the URL for key and for anything under it, if key is a directory"""
+        with self._lock:
+            for entries in (self._entries, self._not_found):
+                for raw_key in [k for k in entries if k == key.raw or k.startswith(key.raw.rstrip("/") + "/")]:
+                    del entries[raw_key]
+
+_object_url_cache = _ObjectUrlCache(max_entries=4096)
+
+
+class _DiskReadCache:
+    """Contents of previous reads, persisted across processes and keyed by what was read. Entries are
+    revalidated against the object's ETag on every read, so a hit saves the transfer but not the round-trip"""
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self._puts_since_eviction = 0
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def _entry_path(self, key: str) -> Path:
+        digest = hashlib.sha1(key.encode("utf8")).hexdigest()
+        return self.root / digest[:2] / digest
+
+    def get(self, key: str) -> "Tuple[bytes, str] | None":
+        entry_path = self._entry_path(key)
+        try:
+            etag = entry_path.with_suffix(".etag").read_text()
+            contents = entry_path.read_bytes()
+            os.utime(entry_path) # mark as recently used for eviction
+        except OSError:
+            return None
+        return (contents, etag)
+
+    def put(self, key: str, contents: bytes, etag: str) -> None:
+        entry_path = self._entry_path(key)
+        try:
+            entry_path.parent.mkdir(parents=True, exist_ok=True)
+            for target, data in [(entry_path, contents), (entry_path.with_suffix(".etag"), etag.encode("utf8"))]:
+                temp_path = target.with_name(f"{target.name}.{uuid.uuid4()}.tmp")
+                _ = temp_path.write_bytes(data)
+                os.replace(temp_path, target)
+        except OSError as e:
+            logger.warn(f"BucketFS: Could not write to disk cache at {entry_path}: {e}")
+            return
+        with self._lock:
+            self._puts_since_eviction += 1
+            if self._puts_since_eviction < 100:
+                return
+            self._puts_since_eviction = 0
+        self._evict()
+
+    def _evict(self) -> None:
+        try:
+            entries = sorted(
+                (entry.stat().st_mtime, entry.stat().st_size, entry)
+                for entry in self.root.glob("*/*")
+                if entry.suffix == ""
+            )
+        except OSError:
+            return
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total_size <= self.max_bytes:
+                break
+            for path in (entry, entry.with_suffix(".etag")):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total_size -= size
+
+_disk_cache_dir = os.environ.get("BUCKET_FS_CACHE_DIR")
+_disk_read_cache: "_DiskReadCache | None" = None if _disk_cache_dir is None else _DiskReadCache(
+    root=Path(_disk_cache_dir),
+    max_bytes=int(os.environ.get("BUCKET_FS_CACHE_MAX_BYTES", 1024 ** 3)),
+)
+
+
+_global_login: "Type[GlobalLogin] | None" = None
+
+def _get_global_login() -> "Type[GlobalLogin]":
+    # GlobalLogin reads the workflow config as soon as it's imported, which would make importing this module fail
+    # wherever there is no such config. So import it on first use only, and only once
+    global _global_login
+    if _global_login is None:
+        from webilastik.libebrains.global_user_login import GlobalLogin
+        _global_login = GlobalLogin
+    return _global_login
+
 def _requests_from_data_proxy(
     method: Literal["get", "put", "delete"],
     url: Url,
     data: Optional[bytes],
     refresh_on_401: bool = True,
 ) -> "Tuple[bytes, CaseInsensitiveDict[str]] | FsFileNotFoundException | Exception":
-    from webilastik.libebrains.global_user_login import GlobalLogin
-
-    user_token = GlobalLogin.get_token()
+    global_login = _get_global_login()
+    user_token = global_login.get_token()
+    raw_url = url.schemeless_raw
     # Changed safe_request to a normal request after object storage migration - Consulation with Oliver S
     try:
-        logger.debug(
-            f"BucketFS: Making {method.upper()} request to data proxy: {url.schemeless_raw}"
-        )
-        response = _data_proxy_session.request(
-            method=method,
-            url=url.schemeless_raw,
-            data=data,
-            headers=user_token.as_ebrains_auth_header(),
-        )
-        logger.debug(f"BucketFS: Data proxy response status: {response.status_code}")
+        def send(token: "AccessToken") -> requests.Response:
+            logger.debug("BucketFS: Making %s request to data proxy: %s", method.upper(), raw_url)
+            response = _data_proxy_session.request(
+                method=method,
+                url=raw_url,
+                data=data,
+                headers=token.as_ebrains_auth_header(),
+            )
+            logger.debug("BucketFS: Data proxy response status: %s", response.status_code)
+            return response
 
-        if response.status_code == 404:
-            logger.debug(f"BucketFS: File not found at data proxy: {url.path}")
-            return FsFileNotFoundException(url.path)  # FIXME
+        response = send(user_token)
         if response.status_code == 401 and refresh_on_401:
-            logger.warning(
+            logger.warn(
                 f"BucketFS: Authentication failed (401) for data proxy, attempting token refresh"
             )
-            refreshed_token_result = GlobalLogin.refresh_token(stale_token=user_token)
+            refreshed_token_result = global_login.refresh_token(stale_token=user_token)
             if isinstance(refreshed_token_result, Exception):
                 logger.error(
                     f"Could not refresh ebrains token in BucketFS: {refreshed_token_result}"
                 )
                 return refreshed_token_result
-            return _requests_from_data_proxy(
-                method=method, url=url, data=data, refresh_on_401=False
-            )
+            response = send(refreshed_token_result)
+
+        if response.status_code == 404:
+            logger.debug("BucketFS: File not found at data proxy: %s", url.path)
+            return FsFileNotFoundException(url.path)  # FIXME
         if not response.ok:
-            logger.error(
-                f"BucketFS: Data proxy request failed with status {response.status_code}"
-            )
-            logger.error(f"BucketFS: Data proxy response text: {response.text[:1000]}")
-            logger.error(
-                f"BucketFS: Data proxy response headers: {dict(response.headers)}"
-            )
-            return ErrRequestCompletedAsFailure(
+            # the error's message already holds the status, text and headers, so log just that
+            failure = ErrRequestCompletedAsFailure(
                 status_code=response.status_code,
                 response_text=response.text[:1000],
-                url=url.schemeless_raw,
+                url=raw_url,
                 headers=response.headers,
             )
+            logger.error(f"BucketFS: Data proxy request failed: {failure}")
+            return failure
         return (response.content, response.headers)
     except Exception as e:
         logger.error(f"BucketFS: Data proxy request crashed: {e}")
         return ErrRequestCrashed(e)
 
 
+_AMZ_SIGNATURE_PATTERN = re.compile(r"(X-Amz-Signature=)([^&]+)")
+_AMZ_CREDENTIAL_PATTERN = re.compile(r"(X-Amz-Credential=)([^&]+)")
+
+_T = TypeVar("_T")
+
+class _AsyncIoRuntime:
+    """An event loop on a daemon thread owning a single aiohttp session, so that many requests can be in flight at
+    once without a thread per request. Coroutines always run on this loop, regardless of the caller's loop (if any)"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: "asyncio.AbstractEventLoop | None" = None
+        self._session: "aiohttp.ClientSession | None" = None
+        self._orphaned_by_fork: List[Tuple[Any, Any]] = []
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+        super().__init__()
+
+    def _reset_after_fork(self) -> None:
+        # The loop thread doesn't survive a fork and the session's sockets belong to the parent, so the child starts
+        # over. The parent's objects are kept referenced so that their finalizers don't touch the parent's sockets
+        self._orphaned_by_fork.append((self._loop, self._session))
+        self._lock = threading.Lock()
+        self._loop = None
+        self._session = None
+
+    def close(self) -> None:
+        with self._lock:
+            loop = self._loop
+            session = self._session
+            self._loop = None
+            self._session = None
+        if loop is None:
+            return
+        if session is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=5)
+            except Exception as e:
+                logger.warn(f"BucketFS: Could not close aiohttp session: {e}")
+        _ = loop.call_soon_threadsafe(loop.stop)
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+        loop.run_forever()
+        loop.close()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=self._run_loop, args=(loop,), name="bucket_fs_io", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def get_session(self) -> aiohttp.ClientSession:
+        # only ever called from within the runtime's loop, so there is no need for locking
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=256, limit_per_host=64, ttl_dns_cache=300),
+            )
+        return self._session
+
+    def run(self, coroutine: Coroutine[Any, Any, _T]) -> _T:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._get_loop()).result()
+
+    async def run_async(self, coroutine: Coroutine[Any, Any, _T]) -> _T:
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self._get_loop()))
+
+_async_io_runtime = _AsyncIoRuntime()
+_ = atexit.register(_async_io_runtime.close)
+
+async def _request_async(
+    method: Literal["get", "put", "delete"],
+    url: "Url | yarl.URL",
+    data: Optional[bytes] = None,
+    headers: "Mapping[str, str] | None" = None,
+) -> "Tuple[int, bytes, CaseInsensitiveDict[str]] | ErrRequestCrashed":
+    try:
+        async with _async_io_runtime.get_session().request(
+            method=method.upper(),
+            url=url.schemeless_raw if isinstance(url, Url) else url,
+            data=data,
+            headers=headers,
+        ) as response:
+            return (response.status, await response.read(), CaseInsensitiveDict(response.headers))
+    except Exception as e:
+        return ErrRequestCrashed(e)
+
+async def _requests_from_data_proxy_async(
+    method: Literal["get", "put", "delete"],
+    url: Url,
+    data: Optional[bytes],
+    refresh_on_401: bool = True,
+) -> "Tuple[bytes, CaseInsensitiveDict[str]] | FsFileNotFoundException | Exception":
+    """Same as _requests_from_data_proxy, but must run on _async_io_runtime"""
+    global_login = _get_global_login()
+    user_token = global_login.get_token()
+    response = await _request_async(
+        method=method, url=url, data=data, headers=user_token.as_ebrains_auth_header()
+    )
+    if not isinstance(response, Exception) and response[0] == 401 and refresh_on_401:
+        logger.warn(
+            f"BucketFS: Authentication failed (401) for data proxy, attempting token refresh"
+        )
+        # refreshing does blocking IO, so keep it off the loop
+        refreshed_token_result = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: global_login.refresh_token(stale_token=user_token)
+        )
+        if isinstance(refreshed_token_result, Exception):
+            logger.error(
+                f"Could not refresh ebrains token in BucketFS: {refreshed_token_result}"
+            )
+            return refreshed_token_result
+        response = await _request_async(
+            method=method, url=url, data=data, headers=refreshed_token_result.as_ebrains_auth_header()
+        )
+    if isinstance(response, Exception):
+        logger.error(f"BucketFS: Data proxy request crashed: {response}")
+        return response
+    status, content, headers = response
+    if status == 404:
+        return FsFileNotFoundException(url.path)  # FIXME
+    if status >= 400:
+        response_text = content[:1000].decode("utf8", errors="replace")
+        logger.error(f"BucketFS: Data proxy request failed with status {status}: {response_text}")
+        return ErrRequestCompletedAsFailure(
+            status_code=status,
+            response_text=response_text,
+            url=url.schemeless_raw,
+            headers=headers,
+        )
+    return (content, headers)
+
+
 class BucketFs(IFilesystem):
     API_URL = Url(
         protocol="https",
         hostname="data-proxy.ebrains.eu",
         path=PurePosixPath("/api/v1/buckets"),
     )
+    _API_PATH_POSIX = API_URL.path.as_posix()
+    _API_PATH_PARTS_LEN = len(API_URL.path.parts)
 
     def __init__(self, bucket_name: str):
         self.bucket_name = bucket_name
@@ -116,20 +443,21 @@ class BucketFs(IFilesystem):
             url.protocol == "https"
             and url.hostname == cls.API_URL.hostname
             and url.port == cls.API_URL.port
-            and url.path.as_posix().startswith(cls.API_URL.path.as_posix())
+            and url.path.as_posix().startswith(cls._API_PATH_POSIX)
         )
 
     @classmethod
     def try_from(cls, url: Url) -> "Tuple[BucketFs, PurePosixPath] | None | Exception":
         if not cls.recognizes(url):
             return None
-        bucket_name_part_index = len(cls.API_URL.path.parts)
-        if len(url.path.parts) <= bucket_name_part_index:
+        bucket_name_part_index = cls._API_PATH_PARTS_LEN
+        url_path_parts = url.path.parts
+        if len(url_path_parts) <= bucket_name_part_index:
             return Exception(f"Bad bucket url: {url}")
         return (
-            BucketFs(bucket_name=url.path.parts[bucket_name_part_index]),
+            BucketFs(bucket_name=url_path_parts[bucket_name_part_index]),
             PurePosixPath(
-                "/".join(url.path.parts[bucket_name_part_index + 1 :]) or "/"
+                "/".join(url_path_parts[bucket_name_part_index + 1 :]) or "/"
             ),
         )
 
@@ -140,22 +468,23 @@ class BucketFs(IFilesystem):
     def to_dto(self) -> BucketFSDto:
         return BucketFSDto(bucket_name=self.bucket_name)
 
-    def list_contents(
-        self, path: PurePosixPath, limit: Optional[int] = 500
-    ) -> "FsDirectoryContents | FsIoException":
-        list_objects_path = self.url.updated_with(
-            extra_search={
-                "delimiter": "/",
-                "prefix": (
-                    ""
-                    if path.as_posix() == "/"
-                    else path.as_posix().lstrip("/").rstrip("/") + "/"
-                ),
-                "limit": str(limit),
-            }
-        )
-        logger.debug(f"BucketFS: Listing contents for path: {path}")
-        logger.debug(f"BucketFS: List objects URL: {list_objects_path.schemeless_raw}")
+    def _fetch_listing(
+        self, path: PurePosixPath, limit: Optional[int], marker: Optional[str] = None
+    ) -> "Sequence[JsonValue] | FsIoException":
+        search = {
+            "delimiter": "/",
+            "prefix": (
+                ""
+                if path.as_posix() == "/"
+                else path.as_posix().lstrip("/").rstrip("/") + "/"
+            ),
+            "limit": str(limit),
+        }
+        if marker is not None:
+            search["marker"] = marker
+        list_objects_path = self.url.updated_with(extra_search=search)
+        logger.debug("BucketFS: Listing contents for path: %s", path)
+        logger.debug("BucketFS: List objects URL: %s", list_objects_path.schemeless_raw)
 
         response = _requests_from_data_proxy(
             method="get", url=list_objects_path, data=None
@@ -169,45 +498,92 @@ class BucketFs(IFilesystem):
                 json.loads(response[0])
             )  # FIXME: use DTOs everywhere?
             raw_objects = ensureJsonArray(payload_obj.get("objects"))
-            logger.debug(f"BucketFS: Found {len(raw_objects)} objects")
+            logger.debug("BucketFS: Found %s objects", len(raw_objects))
         except Exception as e:
             logger.error(f"BucketFS: Failed to parse list response: {e}")
             logger.error(f"BucketFS: Response content: {response[0][:500]}")
             return FsIoException(e)
+        return raw_objects
 
+    @staticmethod
+    def _parse_listing(raw_objects: Sequence[JsonValue]) -> "FsDirectoryContents | FsIoException":
+        # listings can hold thousands of objects, so check them with plain isinstance calls instead of ensureJson*
         files: List[PurePosixPath] = []
         directories: List[PurePosixPath] = []
-        for raw_obj in raw_objects:
-            obj = ensureJsonObject(raw_obj)
-            if "subdir" in obj:
-                path = PurePosixPath("/") / ensureJsonString(
-                    obj.get("subdir")
-                )  # FIXME: Use DTO ?
-                directories.append(path)
-            else:
-                path = PurePosixPath("/") / ensureJsonString(
-                    obj.get("name")
-                )  # FIXME: Use DTO ?
-                files.append(path)
-        logger.debug(
-            f"BucketFS: Listed {len(files)} files and {len(directories)} directories"
-        )
-        return FsDirectoryContents(files=files, directories=directories)
+        file_sizes: Dict[PurePosixPath, int] = {}
+        for obj in raw_objects:
+            if not isinstance(obj, dict):
+                return FsIoException(f"Bad object in listing: {obj}")
+            subdir = obj.get("subdir")
+            if subdir is not None:
+                if not isinstance(subdir, str):
+                    return FsIoException(f"Bad subdir in listing: {obj}")
+                directories.append(PurePosixPath("/", subdir))
+                continue
+            name = obj.get("name")
+            if not isinstance(name, str):
+                return FsIoException(f"Bad object name in listing: {obj}")
+            file_path = PurePosixPath("/", name)
+            files.append(file_path)
+            size = obj.get("bytes")
+            if isinstance(size, int):
+                file_sizes[file_path] = size
+        logger.debug("BucketFS: Listed %s files and %s directories", len(files), len(directories))
+        return FsDirectoryContents(files=files, directories=directories, file_sizes=file_sizes)
+
+    def _directory_exists(self, path: PurePosixPath) -> "bool | FsIoException":
+        """Checks for anything under path while only ever transferring a single listing entry"""
+        raw_objects = self._fetch_listing(path=path, limit=1)
+        if isinstance(raw_objects, Exception):
+            return raw_objects
+        return len(raw_objects) > 0
+
+    def list_contents(
+        self, path: PurePosixPath, limit: Optional[int] = 500, marker: Optional[str] = None
+    ) -> "FsDirectoryContents | FsIoException":
+        """Lists up to 'limit' entries under path, starting after the object key 'marker'"""
+        raw_objects = self._fetch_listing(path=path, limit=limit, marker=marker)
+        if isinstance(raw_objects, Exception):
+            return raw_objects
+        return self._parse_listing(raw_objects)
+
+    def list_contents_all(
+        self, path: PurePosixPath, page_size: int = 10000
+    ) -> "Iterator[FsDirectoryContents | FsIoException]":
+        """Lists everything under path, one page at a time. The next page is already being requested while
+        the current one is parsed and consumed"""
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_page = executor.submit(self._fetch_listing, path, page_size)
+            while True:
+                raw_objects = next_page.result()
+                if isinstance(raw_objects, Exception):
+                    yield raw_objects
+                    return
+                is_last_page = len(raw_objects) < page_size
+                if not is_last_page:
+                    last_obj = raw_objects[-1]
+                    last_key = (last_obj.get("subdir") or last_obj.get("name")) if isinstance(last_obj, dict) else None
+                    if not isinstance(last_key, str):
+                        yield FsIoException(f"Bad object in listing: {last_obj}")
+                        return
+                    next_page = executor.submit(self._fetch_listing, path, page_size, last_key)
+                yield self._parse_listing(raw_objects)
+                if is_last_page:
+                    return
 
     def _parse_url_from_data_proxy_response(
         self, response_payload: bytes
     ) -> "Url | Exception":
-        response_json_result = parse_json(response_payload)
-        if isinstance(response_json_result, Exception):
-            return response_json_result
-        response_dto_result = DataProxyObjectUrlResponse.from_json_value(
-            response_json_result
-        )
-        if isinstance(response_dto_result, Exception):
-            return response_dto_result
-        raw_url = response_dto_result.url
+        # this runs for every uncached object URL, so pick the url out directly instead of going through a DTO
+        try:
+            response_obj = json.loads(response_payload)
+        except ValueError as e:
+            return e
+        raw_url = response_obj.get("url") if isinstance(response_obj, dict) else None
+        if not isinstance(raw_url, str):
+            return Exception(f"Bad object URL response from data proxy: {response_payload[:500]!r}")
         
-        logger.debug(f"BucketFS: Raw URL from data proxy: {raw_url[:200]}...")
+        logger.debug("BucketFS: Raw URL from data proxy: %s...", raw_url[:200])
 
         # Fix for S3 presigned URLs: encode spaces in query params (was fine with old Swift URLs)
         # Only encode spaces, NOT semicolons (they're part of response-content-disposition syntax)
@@ -227,7 +603,7 @@ class BucketFs(IFilesystem):
             fixed_signature = signature.replace("+", "%2B").replace("/", "%2F")
             return f"{prefix}{fixed_signature}"
 
-        fixed_url = re.sub(r"(X-Amz-Signature=)([^&]+)", encode_signature_special_chars, fixed_url)
+        fixed_url = _AMZ_SIGNATURE_PATTERN.sub(encode_signature_special_chars, fixed_url)
         
         # Also need to encode / in X-Amz-Credential if not already encoded
         def encode_credential_slashes(match: re.Match[str]) -> str:
@@ -239,9 +615,9 @@ class BucketFs(IFilesystem):
                 return f"{prefix}{fixed_credential}"
             return match.group(0)
         
-        fixed_url = re.sub(r"(X-Amz-Credential=)([^&]+)", encode_credential_slashes, fixed_url)
+        fixed_url = _AMZ_CREDENTIAL_PATTERN.sub(encode_credential_slashes, fixed_url)
         
-        logger.debug(f"BucketFS: Fixed URL for S3: {fixed_url[:200]}...")
+        logger.debug("BucketFS: Fixed URL for S3: %s...", fixed_url[:200])
 
         # CRITICAL: For presigned URLs (both Swift and S3), we MUST preserve the exact URL string
         # because the signature is computed over it. Parsing and re-encoding will break the signature.
@@ -266,7 +642,8 @@ class BucketFs(IFilesystem):
     def create_file(
         self, *, path: PurePosixPath, contents: bytes
     ) -> "None | FsIoException":
-        logger.debug(f"BucketFS: Creating file at path: {path}")
+        logger.debug("BucketFS: Creating file at path: %s", path)
+        _object_url_cache.invalidate(self.url.concatpath(path))
         response = _requests_from_data_proxy(
             method="put", url=self.url.concatpath(path), data=None
         )
@@ -284,31 +661,15 @@ class BucketFs(IFilesystem):
                 f"Could not parse CSCS object URL (write): {cscs_url_result}"
             )
 
-        logger.debug(
-            f"BucketFS: Uploading to CSCS URL: {cscs_url_result.schemeless_raw}"
-        )
-        logger.debug(f"BucketFS: Upload payload size: {len(contents)} bytes")
+        logger.debug("BucketFS: Uploading to CSCS URL: %s", cscs_url_result.schemeless_raw)
+        logger.debug("BucketFS: Upload payload size: %s bytes", len(contents))
         response = safe_request(
             session=_cscs_session, method="put", url=cscs_url_result, data=contents
         )
         if isinstance(response, Exception):
             logger.error(f"BucketFS: CSCS upload failed: {response}")
-            if isinstance(response, ErrRequestCompletedAsFailure):
-                logger.error(
-                    f"BucketFS: CSCS upload status code: {response.status_code}"
-                )
-                logger.error(
-                    f"BucketFS: CSCS upload response text: {response.response_text}"
-                )
-                logger.error(f"BucketFS: CSCS upload URL: {response.url}")
-                logger.error(
-                    f"BucketFS: CSCS upload response headers: {dict(response.headers)}"
-                )
-                logger.error(
-                    f"BucketFS: CSCS upload request headers: {response.request_headers}"
-                )
             return FsIoException(response)
-        logger.debug(f"BucketFS: File successfully uploaded to CSCS")
+        logger.debug("BucketFS: File successfully uploaded to CSCS")
         return None
 
     def create_directory(self, path: PurePosixPath) -> "None | FsIoException":
@@ -317,17 +678,36 @@ class BucketFs(IFilesystem):
     def get_swift_object_url(
         self, path: PurePosixPath
     ) -> "Url | FsIoException | FsFileNotFoundException":
-        file_url = self.url.concatpath(path).updated_with(
+        object_url = self.url.concatpath(path)
+        cached_url = _object_url_cache.get(object_url)
+        if cached_url is not None:
+            return cached_url
+        if _object_url_cache.is_not_found(object_url):
+            return FsFileNotFoundException(path)
+        with _object_url_cache.fetching(object_url):
+            # someone else might have fetched it while we waited
+            cached_url = _object_url_cache.get(object_url)
+            if cached_url is not None:
+                return cached_url
+            if _object_url_cache.is_not_found(object_url):
+                return FsFileNotFoundException(path)
+            return self._fetch_swift_object_url(object_url=object_url, path=path)
+
+    def _fetch_swift_object_url(
+        self, object_url: Url, path: PurePosixPath
+    ) -> "Url | FsIoException | FsFileNotFoundException":
+        file_url = object_url.updated_with(
             extra_search={"redirect": "false"}
         )
-        logger.debug(f"BucketFS: Getting Swift object URL for path: {path}")
-        logger.debug(f"BucketFS: Data proxy URL: {file_url.schemeless_raw}")
+        logger.debug("BucketFS: Getting Swift object URL for path: %s", path)
+        logger.debug("BucketFS: Data proxy URL: %s", file_url.schemeless_raw)
 
         data_proxy_response = _requests_from_data_proxy(
             method="get", url=file_url, data=None
         )
         if isinstance(data_proxy_response, FsFileNotFoundException):
-            logger.debug(f"BucketFS: File not found in data proxy: {path}")
+            logger.debug("BucketFS: File not found in data proxy: %s", path)
+            _object_url_cache.put_not_found(object_url)
             return FsFileNotFoundException(path)
         if isinstance(data_proxy_response, Exception):
             logger.error(
@@ -351,109 +731,243 @@ class BucketFs(IFilesystem):
                 f"Could not parse CSCS object URL (read): {cscs_url_result}"
             )
 
-        logger.debug(f"BucketFS: Retrieved CSCS URL: {cscs_url_result.schemeless_raw}")
+        logger.debug("BucketFS: Retrieved CSCS URL: %s", cscs_url_result.schemeless_raw)
+        _object_url_cache.put(object_url, cscs_url_result)
         return cscs_url_result
 
+    def _request_from_cscs(
+        self, path: PurePosixPath, offset: int, num_bytes: "int | None", etag: "str | None" = None
+    ) -> "Tuple[bytes, CaseInsensitiveDict[str]] | FsIoException | FsFileNotFoundException | ErrRequestCompletedAsFailure | ErrRequestCrashed":
+        def send() -> "Tuple[bytes, CaseInsensitiveDict[str]] | FsIoException | FsFileNotFoundException | ErrRequestCompletedAsFailure | ErrRequestCrashed":
+            cscs_url_result = self.get_swift_object_url(path=path)
+            if isinstance(cscs_url_result, Exception):
+                return cscs_url_result
+            return safe_request(
+                session=_cscs_session,
+                method="get",
+                url=cscs_url_result,
+                offset=offset,
+                num_bytes=num_bytes,
+                headers=None if etag is None else {"If-None-Match": etag},
+            )
+
+        cscs_response = send()
+        # a cached presigned URL might have been revoked or have expired early; retry once with a fresh one
+        if isinstance(cscs_response, ErrRequestCompletedAsFailure) and cscs_response.status_code in (401, 403):
+            _object_url_cache.invalidate(self.url.concatpath(path))
+            cscs_response = send()
+        return cscs_response
+
+    def _read_through_disk_cache(
+        self, disk_cache: _DiskReadCache, path: PurePosixPath, offset: int, num_bytes: "int | None"
+    ) -> "Tuple[bytes, CaseInsensitiveDict[str]] | FsIoException | FsFileNotFoundException | ErrRequestCompletedAsFailure | ErrRequestCrashed":
+        key = f"{self.bucket_name}{path.as_posix()}:{offset}:{num_bytes}"
+        cached = disk_cache.get(key)
+        cscs_response = self._request_from_cscs(
+            path=path, offset=offset, num_bytes=num_bytes, etag=None if cached is None else cached[1]
+        )
+        if isinstance(cscs_response, Exception):
+            return cscs_response
+        etag = cscs_response[1].get("etag")
+        if cached is not None:
+            if etag == cached[1]: # unchanged object, either a 304 or a full response we can ignore
+                return (cached[0], cscs_response[1])
+            if etag is None and len(cscs_response[0]) == 0: # can't tell a 304 from an empty read, so ask again
+                cscs_response = self._request_from_cscs(path=path, offset=offset, num_bytes=num_bytes)
+                if isinstance(cscs_response, Exception):
+                    return cscs_response
+        if etag is not None:
+            disk_cache.put(key, cscs_response[0], etag)
+        return cscs_response
+
     def read_file(
         self, path: PurePosixPath, offset: int = 0, num_bytes: "int | None" = None
     ) -> "bytes | FsIoException | FsFileNotFoundException":
-        logger.debug(
-            f"BucketFS: Reading file at path: {path}, offset: {offset}, num_bytes: {num_bytes}"
-        )
-        cscs_url_result = self.get_swift_object_url(path=path)
-        if isinstance(cscs_url_result, Exception):
+        logger.debug("BucketFS: Reading file at path: %s, offset: %s, num_bytes: %s", path, offset, num_bytes)
+        if _disk_read_cache is None:
+            cscs_response = self._request_from_cscs(path=path, offset=offset, num_bytes=num_bytes)
+        else:
+            cscs_response = self._read_through_disk_cache(_disk_read_cache, path=path, offset=offset, num_bytes=num_bytes)
+        if isinstance(cscs_response, (FsIoException, FsFileNotFoundException)):
             logger.error(
-                f"BucketFS: Failed to get CSCS URL for file read: {cscs_url_result}"
+                f"BucketFS: Failed to get CSCS URL for file read: {cscs_response}"
             )
-            return cscs_url_result
-
-        logger.debug(
-            f"BucketFS: Reading from CSCS URL: {cscs_url_result.schemeless_raw}"
-        )
-        cscs_response = safe_request(
-            session=_cscs_session,
-            method="get",
-            url=cscs_url_result,
-            offset=offset,
-            num_bytes=num_bytes,
-        )
+            return cscs_response
         if isinstance(cscs_response, Exception):
             logger.error(f"BucketFS: CSCS read failed: {cscs_response}")
-            if isinstance(cscs_response, ErrRequestCompletedAsFailure):
-                logger.error(
-                    f"BucketFS: CSCS read status code: {cscs_response.status_code}"
-                )
-                logger.error(
-                    f"BucketFS: CSCS read response text: {cscs_response.response_text}"
-                )
-                logger.error(f"BucketFS: CSCS read URL: {cscs_response.url}")
-                logger.error(
-                    f"BucketFS: CSCS read response headers: {dict(cscs_response.headers)}"
-                )
-                logger.error(
-                    f"BucketFS: CSCS read request headers: {cscs_response.request_headers}"
-                )
             return FsIoException(
                 cscs_response
             )  # FIXME: pass exception directly into other?
-        logger.debug(
-            f"BucketFS: Successfully read {len(cscs_response[0])} bytes from CSCS"
-        )
+        logger.debug("BucketFS: Successfully read %s bytes from CSCS", len(cscs_response[0]))
         return cscs_response[0]
 
-    def get_size(
+    def read_files(
+        self, paths: Sequence[PurePosixPath], max_workers: int = 16
+    ) -> "List[bytes | FsIoException | FsFileNotFoundException]":
+        """Reads all of paths concurrently. Reading is dominated by waiting on the data proxy and CSCS, so
+        this takes about as long as the slowest read instead of the sum of all of them. max_workers only
+        applies when reading through the disk cache, which still uses a thread per read"""
+        if len(paths) <= 1:
+            return [self.read_file(path) for path in paths]
+        if _disk_read_cache is None:
+            # no thread per in-flight request needed, so all reads can be in flight at once
+            async def read_all() -> "List[bytes | FsIoException | FsFileNotFoundException]":
+                return list(await asyncio.gather(*(self._read_file_async(path, offset=0, num_bytes=None) for path in paths)))
+            return _async_io_runtime.run(read_all())
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+            return list(executor.map(self.read_file, paths))
+
+    async def _get_swift_object_url_async(
         self, path: PurePosixPath
-    ) -> "int | FsIoException | FsFileNotFoundException":
-        logger.debug(f"BucketFS: Getting size for path: {path}")
-        cscs_url_result = self.get_swift_object_url(path=path)
+    ) -> "Url | FsIoException | FsFileNotFoundException":
+        object_url = self.url.concatpath(path)
+        cached_url = _object_url_cache.get(object_url)
+        if cached_url is not None:
+            return cached_url
+        if _object_url_cache.is_not_found(object_url):
+            return FsFileNotFoundException(path)
+        data_proxy_response = await _requests_from_data_proxy_async(
+            method="get", url=object_url.updated_with(extra_search={"redirect": "false"}), data=None
+        )
+        if isinstance(data_proxy_response, FsFileNotFoundException):
+            _object_url_cache.put_not_found(object_url)
+            return FsFileNotFoundException(path)
+        if isinstance(data_proxy_response, Exception):
+            return FsIoException(data_proxy_response)
+        cscs_url_result = self._parse_url_from_data_proxy_response(data_proxy_response[0])
         if isinstance(cscs_url_result, Exception):
-            logger.error(
-                f"BucketFS: Failed to get CSCS URL for size check: {cscs_url_result}"
+            return FsIoException(f"Could not parse CSCS object URL (read): {cscs_url_result}")
+        _object_url_cache.put(object_url, cscs_url_result)
+        return cscs_url_result
+
+    async def _read_file_async(
+        self, path: PurePosixPath, offset: int, num_bytes: "int | None"
+    ) -> "bytes | FsIoException | FsFileNotFoundException":
+        for _ in range(2):
+            cscs_url_result = await self._get_swift_object_url_async(path=path)
+            if isinstance(cscs_url_result, Exception):
+                return cscs_url_result
+            cscs_response = await _request_async(
+                method="get",
+                # presigned URLs must be sent exactly as they were received, or their signatures won't match
+                url=yarl.URL(cscs_url_result.schemeless_raw, encoded=True),
+                headers=range_headers(offset=offset, num_bytes=num_bytes),
             )
-            return cscs_url_result
+            if isinstance(cscs_response, Exception):
+                return FsIoException(cscs_response)
+            status, content, headers = cscs_response
+            if status in (401, 403):
+                _object_url_cache.invalidate(self.url.concatpath(path))
+                continue
+            if status == 404:
+                return FsFileNotFoundException(path)
+            if status >= 400:
+                return FsIoException(ErrRequestCompletedAsFailure(
+                    status_code=status,
+                    response_text=content[:1000].decode("utf8", errors="replace"),
+                    url=cscs_url_result.schemeless_raw,
+                    headers=headers,
+                ))
+            return content if num_bytes is None else content[:num_bytes]
+        return FsIoException(f"Could not get a usable CSCS URL for {path}")
 
-        logger.debug(
-            f"BucketFS: Checking size at CSCS URL: {cscs_url_result.schemeless_raw}"
+    async def _create_file_async(self, path: PurePosixPath, contents: bytes) -> "None | FsIoException":
+        _object_url_cache.invalidate(self.url.concatpath(path))
+        response = await _requests_from_data_proxy_async(
+            method="put", url=self.url.concatpath(path), data=None
         )
-        size_result = request_size(session=_cscs_session, url=cscs_url_result)
-        if isinstance(size_result, ErrRequestCompletedAsFailure):
-            logger.error(
-                f"BucketFS: CSCS size check failed with status: {size_result.status_code}"
-            )
-            if hasattr(size_result, "response_text"):
-                logger.error(
-                    f"BucketFS: CSCS size check response text: {size_result.response_text}"
-                )
-            if hasattr(size_result, "url"):
-                logger.error(f"BucketFS: CSCS size check URL: {size_result.url}")
-            if hasattr(size_result, "headers"):
-                logger.error(
-                    f"BucketFS: CSCS size check response headers: {dict(size_result.headers)}"
-                )
-            if hasattr(size_result, "request_headers"):
+        if isinstance(response, Exception):
+            return FsIoException(response)
+        cscs_url_result = self._parse_url_from_data_proxy_response(response[0])
+        if isinstance(cscs_url_result, Exception):
+            return FsIoException(f"Could not parse CSCS object URL (write): {cscs_url_result}")
+        cscs_response = await _request_async(
+            method="put", url=yarl.URL(cscs_url_result.schemeless_raw, encoded=True), data=contents
+        )
+        if isinstance(cscs_response, Exception):
+            return FsIoException(cscs_response)
+        status, content, headers = cscs_response
+        if status >= 400:
+            return FsIoException(ErrRequestCompletedAsFailure(
+                status_code=status,
+                response_text=content[:1000].decode("utf8", errors="replace"),
+                url=cscs_url_result.schemeless_raw,
+                headers=headers,
+            ))
+        return None
+
+    async def read_file_async(
+        self, path: PurePosixPath, offset: int = 0, num_bytes: "int | None" = None
+    ) -> "bytes | FsIoException | FsFileNotFoundException":
+        """Like read_file, but can be awaited from any event loop without blocking it"""
+        return await _async_io_runtime.run_async(self._read_file_async(path, offset=offset, num_bytes=num_bytes))
+
+    async def create_file_async(self, *, path: PurePosixPath, contents: bytes) -> "None | FsIoException":
+        """Like create_file, but can be awaited from any event loop without blocking it"""
+        return await _async_io_runtime.run_async(self._create_file_async(path, contents=contents))
+
+    def get_size(
+        self, path: PurePosixPath
+    ) -> "int | FsIoException | FsFileNotFoundException":
+        logger.debug("BucketFS: Getting size for path: %s", path)
+        def send() -> "int | FsIoException | FsFileNotFoundException | ErrRequestCompletedAsFailure | ErrRequestCrashed | ErrBadContentLength":
+            cscs_url_result = self.get_swift_object_url(path=path)
+            if isinstance(cscs_url_result, Exception):
                 logger.error(
-                    f"BucketFS: CSCS size check request headers: {size_result.request_headers}"
+                    f"BucketFS: Failed to get CSCS URL for size check: {cscs_url_result}"
                 )
+                return cscs_url_result
+
+            logger.debug("BucketFS: Checking size at CSCS URL: %s", cscs_url_result.schemeless_raw)
+            return request_size(session=_cscs_session, url=cscs_url_result)
+
+        size_result = send()
+        # a cached presigned URL might have been revoked or have expired early; retry once with a fresh one
+        if isinstance(size_result, ErrRequestCompletedAsFailure) and size_result.status_code in (401, 403):
+            _object_url_cache.invalidate(self.url.concatpath(path))
+            size_result = send()
+        if isinstance(size_result, (FsIoException, FsFileNotFoundException)):
+            return size_result
+        if isinstance(size_result, ErrRequestCompletedAsFailure):
             if size_result.status_code == 404:
                 return FsFileNotFoundException(path)
             else:
+                logger.error(f"BucketFS: CSCS size check failed: {size_result}")
                 return FsIoException(size_result)
         if isinstance(size_result, Exception):
             logger.error(f"BucketFS: CSCS size check crashed: {size_result}")
             return FsIoException(size_result)
-        logger.debug(f"BucketFS: File size: {size_result} bytes")
+        logger.debug("BucketFS: File size: %s bytes", size_result)
         return size_result
 
+    def get_sizes(
+        self, paths: Sequence[PurePosixPath]
+    ) -> "Dict[PurePosixPath, int | FsIoException | FsFileNotFoundException]":
+        """Gets the sizes of all of paths with one listing per parent directory instead of a couple of requests
+        per file. Files missing from the listings are looked up individually with get_size"""
+        paths_by_parent: Dict[PurePosixPath, List[PurePosixPath]] = {}
+        for path in paths:
+            paths_by_parent.setdefault(PurePosixPath("/", path).parent, []).append(path)
+
+        out: "Dict[PurePosixPath, int | FsIoException | FsFileNotFoundException]" = {}
+        for parent, children in paths_by_parent.items():
+            listed_sizes: Dict[PurePosixPath, int] = {}
+            for page in self.list_contents_all(parent):
+                if isinstance(page, Exception):
+                    break
+                listed_sizes.update(page.file_sizes)
+            for child in children:
+                size = listed_sizes.get(PurePosixPath("/", child))
+                out[child] = self.get_size(child) if size is None else size
+        return out
+
     def delete(
         self,
         path: PurePosixPath,
         dir_wait_time: Seconds = Seconds(5),
-        dir_wait_interval: Seconds = Seconds(0.2),
+        dir_wait_interval: Seconds = Seconds(0.05),
     ) -> "None | FsIoException":
-        dir_contents_result = self.list_contents(path.parent)
-        if isinstance(dir_contents_result, Exception):
-            return dir_contents_result
-
+        _object_url_cache.invalidate(self.url.concatpath(path))
         deletion_response = _requests_from_data_proxy(
             method="delete", url=self.url.concatpath(path), data=None
         )
@@ -461,19 +975,22 @@ class BucketFs(IFilesystem):
         if isinstance(deletion_response, Exception):
             return FsIoException(deletion_response)
 
-        if path in dir_contents_result.files:
-            return None
-        if path in dir_contents_result.directories:
-            while dir_wait_time > Seconds(0):
-                parent_contents_result = self.list_contents(path.parent)
-                if isinstance(parent_contents_result, Exception):
-                    return parent_contents_result
-                if path not in parent_contents_result.directories:
-                    return None
-                time.sleep(dir_wait_interval.to_float())
-                dir_wait_time -= dir_wait_interval
-        # FIXME: i think this might me unreachable
-        return FsIoException("Not found")
+        # Deleting a file is done once the request succeeds, but directory deletions are asynchronous. Rather than
+        # listing the parent up front to tell them apart, probe for leftovers under path, which is empty for files.
+        # Poll with a growing interval since most directory deletions finish almost immediately
+        interval = dir_wait_interval.to_float()
+        deadline = time.monotonic() + dir_wait_time.to_float()
+        while True:
+            exists_result = self._directory_exists(path)
+            if isinstance(exists_result, Exception):
+                return exists_result
+            if not exists_result:
+                return None
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return FsIoException(f"Timed out waiting for {path} to be deleted")
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 1.8, 1.0)
 
     def geturl(self, path: PurePosixPath) -> Url:
         return self.url.concatpath(path)
@@ -511,7 +1028,8 @@ class BucketFs(IFilesystem):
                 source_fs=source_fs, source_path=source_path, target_path=target_path
             )
 
-        logger.debug(f"BucketFS: Transferring file from {source_path} to {target_path}")
+        logger.debug("BucketFS: Transferring file from %s to %s", source_path, target_path)
+        _object_url_cache.invalidate(self.url.concatpath(target_path))
         response = _requests_from_data_proxy(
             method="put", url=self.url.concatpath(target_path), data=None
         )
@@ -520,32 +1038,104 @@ class BucketFs(IFilesystem):
                 f"BucketFS: Failed to get CSCS URL for file transfer: {response}"
             )
             return FsIoException(response)
-        response_obj = ensureJsonObject(json.loads(response[0]))
-        cscs_url = Url.parse_or_raise(
-            ensureJsonString(response_obj.get("url"))
-        )  # FIXME: could raise
+        cscs_url = self._parse_url_from_data_proxy_response(response[0])
+        if isinstance(cscs_url, Exception):
+            logger.error(f"BucketFS: Could not parse CSCS object URL (transfer): {cscs_url}")
+            return FsIoException(f"Could not parse CSCS object URL (transfer): {cscs_url}")
 
-        logger.debug(f"BucketFS: Transferring to CSCS URL: {cscs_url.schemeless_raw}")
-        source_file = source_fs.resolve_path(source_path).open("rb")
-        response = safe_request(
-            session=_cscs_session, method="put", url=cscs_url, data=source_file
-        )
+        logger.debug("BucketFS: Transferring to CSCS URL: %s", cscs_url.schemeless_raw)
+        try:
+            with source_fs.resolve_path(source_path).open("rb") as source_file:
+                # an explicit length lets the file be streamed as-is rather than with chunked transfer encoding
+                response = safe_request(
+                    session=_cscs_session,
+                    method="put",
+                    url=cscs_url,
+                    data=source_file,
+                    headers={"Content-Length": str(os.fstat(source_file.fileno()).st_size)},
+                )
+        except FileNotFoundError:
+            return FsFileNotFoundException(source_path)
+        except OSError as e:
+            return FsIoException(e)
         if isinstance(response, Exception):
             logger.error(f"BucketFS: CSCS transfer failed: {response}")
-            if isinstance(response, ErrRequestCompletedAsFailure):
-                logger.error(
-                    f"BucketFS: CSCS transfer status code: {response.status_code}"
-                )
-                logger.error(
-                    f"BucketFS: CSCS transfer response text: {response.response_text}"
-                )
-                logger.error(f"BucketFS: CSCS transfer URL: {response.url}")
-                logger.error(
-                    f"BucketFS: CSCS transfer response headers: {dict(response.headers)}"
-                )
-                logger.error(
-                    f"BucketFS: CSCS transfer request headers: {response.request_headers}"
-                )
             return FsIoException(response)
-        logger.debug(f"BucketFS: File successfully transferred to CSCS")
+        logger.debug("BucketFS: File successfully transferred to CSCS")
         return None
+
+
+class ReadAheadBucketFs(BucketFs):
+    """A BucketFs that reads at least `readahead` bytes at a time and serves later ranged reads of the same file
+    from that window, so that sequentially reading a file in small pieces costs one request instead of one per piece.
+
+    Windows are not revalidated, so this should only be used for files that don't change while being read."""
+
+    READAHEAD: int = int(os.environ.get("BUCKET_FS_READAHEAD", 1024 * 1024))
+
+    def __init__(self, bucket_name: str, readahead: "int | None" = None, max_windows: int = 64):
+        self.readahead = self.READAHEAD if readahead is None else readahead
+        self.max_windows = max_windows
+        # path -> (window start offset, window contents, whether the window reaches the end of the file)
+        self._readahead: "OrderedDict[PurePosixPath, Tuple[int, bytes, bool]]" = OrderedDict()
+        self._readahead_lock = threading.Lock()
+        super().__init__(bucket_name=bucket_name)
+
+    def _read_from_window(self, path: PurePosixPath, offset: int, num_bytes: int) -> "bytes | None":
+        with self._readahead_lock:
+            window = self._readahead.get(path)
+            if window is None:
+                return None
+            start, contents, reaches_eof = window
+            end = start + len(contents)
+            if offset < start or offset >= end or (offset + num_bytes > end and not reaches_eof):
+                return None
+            self._readahead.move_to_end(path)
+        return contents[offset - start : offset - start + num_bytes]
+
+    def _forget(self, path: PurePosixPath) -> None:
+        with self._readahead_lock:
+            for cached_path in list(self._readahead.keys()):
+                if cached_path == path or path in cached_path.parents:
+                    del self._readahead[cached_path]
+
+    def read_file(
+        self, path: PurePosixPath, offset: int = 0, num_bytes: "int | None" = None
+    ) -> "bytes | FsIoException | FsFileNotFoundException":
+        if num_bytes is None or num_bytes >= self.readahead:
+            return super().read_file(path=path, offset=offset, num_bytes=num_bytes)
+        from_window = self._read_from_window(path, offset=offset, num_bytes=num_bytes)
+        if from_window is not None:
+            return from_window
+        window_result = super().read_file(path=path, offset=offset, num_bytes=self.readahead)
+        if isinstance(window_result, Exception):
+            return window_result
+        with self._readahead_lock:
+            self._readahead[path] = (offset, window_result, len(window_result) < self.readahead)
+            self._readahead.move_to_end(path)
+            while len(self._readahead) > self.max_windows:
+                _ = self._readahead.popitem(last=False)
+        return window_result[:num_bytes]
+
+    def create_file(self, *, path: PurePosixPath, contents: bytes) -> "None | FsIoException":
+        self._forget(path)
+        return super().create_file(path=path, contents=contents)
+
+    def delete(
+        self,
+        path: PurePosixPath,
+        dir_wait_time: Seconds = Seconds(5),
+        dir_wait_interval: Seconds = Seconds(0.05),
+    ) -> "None | FsIoException":
+        self._forget(path)
+        return super().delete(path=path, dir_wait_time=dir_wait_time, dir_wait_interval=dir_wait_interval)
+
+    def transfer_file(
+        self,
+        *,
+        source_fs: IFilesystem,
+        source_path: PurePosixPath,
+        target_path: PurePosixPath,
+    ) -> "FsIoException | FsFileNotFoundException | None":
+        self._forget(target_path)
+        return super().transfer_file(source_fs=source_fs, source_path=source_path, target_path=target_path)
@@ -8,7 +8,11 @@ from requests.models import CaseInsensitiveDict
 from webilastik.filesystem import IFilesystem, FsIoException, FsFileNotFoundException, FsDirectoryContents
 from webilastik.utility.url import Url
 from webilastik.server.rpc.dto import HttpFsDto
-from webilastik.utility.request import ErrRequestCompletedAsFailure, ErrRequestCrashed, request as safe_request, request_size
+from webilastik.utility.request import (
+    ErrRequestCompletedAsFailure, ErrRequestCrashed, make_session, request as safe_request, request_size
+)
+
+_session = make_session()
 
 
 class HttpFs(IFilesystem):
@@ -30,7 +34,7 @@ class HttpFs(IFilesystem):
             port=port,
             search=search,
         )
-        self.session = requests.Session()
+        self.session = _session
 
     @classmethod
     def try_from(cls, *, url: Url) -> "Tuple[HttpFs, PurePosixPath] | None | Exception":
@@ -134,7 +138,7 @@ class HttpFs(IFilesystem):
         url = self.base.concatpath(source)
         try:
             with open(destination, "wb") as f:
-                with requests.get(url.raw, stream=True) as r:
+                with self.session.get(url.raw, stream=True) as r:
                     content_length = int(r.headers['content-length'])
                     total_bytes_written = 0
                     for chunk  in r.iter_content(chunk_size=chunk_size, decode_unicode=False):
@@ -1,7 +1,8 @@
 # pyright: strict
 
 from pathlib import PurePosixPath
-from typing import ClassVar, Dict, Final, Literal
+from types import MappingProxyType
+from typing import ClassVar, Final, Literal, Mapping
 from typing_extensions import assert_never
 import uuid
 from datetime import datetime, timezone, timedelta
@@ -229,6 +230,8 @@ class AccessToken:
         self.payload = payload
         self.raw_token: Final[str] = header.raw + "." + payload.raw + "." + raw_signature
         self.refresh_token = refresh_token
+        # sent with every data proxy request, so build it just once
+        self._ebrains_auth_header: Final[Mapping[str, str]] = MappingProxyType({"Authorization": f"Bearer {self.raw_token}"})
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, AccessToken):
@@ -258,8 +261,8 @@ class AccessToken:
             return AccessTokenInvalid("Badly encoded authentication token")
         return cls.from_raw_token(raw_token=parts[1], refresh_token=refresh_header, checking_key=checking_key)
 
-    def as_ebrains_auth_header(self) -> Dict[str, str]:
-        return {"Authorization": f"Bearer {self.raw_token}"}
+    def as_ebrains_auth_header(self) -> Mapping[str, str]:
+        return self._ebrains_auth_header
 
     async def get_userinfo(self, http_client_session: ClientSession) -> "UserInfo | Exception":
         url = self._api_url.concatpath(PurePosixPath("userinfo")).updated_with(search={})
@@ -13,5 +13,15 @@ class OpRetriever(Operator[DataRoi, Array5D]):
     def __init__(self, axiskeys_hint: str = "ctzyx") -> None:
         self.axiskeys_hint = axiskeys_hint
         super().__init__()
+
+    # Retrievers are compared by value so that equivalent feature extractors that were handed different
+    # retriever instances still share their entries in global_cache (e.g. the same presmoothing being
+    # shared by all filters of the same scale)
+    def __hash__(self) -> int:
+        return hash((self.__class__, self.axiskeys_hint))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, OpRetriever) and self.axiskeys_hint == other.axiskeys_hint
+
     def __call__(self, /, roi: DataRoi) -> Array5D:
         return roi.retrieve(axiskeys_hint=self.axiskeys_hint)
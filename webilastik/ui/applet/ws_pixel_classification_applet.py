@@ -1,12 +1,21 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
 from pathlib import PurePosixPath
-from typing import Optional, List
+from typing import Any, Dict, Hashable, Iterator, Literal, Optional, List, Sequence, Set, Tuple
 import asyncio
+import hashlib
+import json
+import threading
 
 import numpy as np
 from ndstructs.utils.json_serializable import JsonObject, JsonValue, ensureJsonBoolean
 from aiohttp import web
-from webilastik.classifiers.pixel_classifier import PixelClassifier, VigraPixelClassifier
+from webilastik.classifiers.pixel_classifier import (
+    ClassifierNotCached, PixelClassifier, Predictions, VigraPixelClassifier, predict_with_cached_classifier
+)
 
+from webilastik.annotations import Color
 from webilastik.datasource import DataRoi, FsDataSource
 from webilastik.datasource.precomputed_chunks_info import PrecomputedChunksInfo, PrecomputedChunksScale, RawEncoder
 from webilastik.server.rpc import MessageParsingError
@@ -17,6 +26,116 @@ from webilastik.ui.applet.ws_applet import WsApplet
 from webilastik.ui.usage_error import UsageError
 from webilastik.ui.datasource import get_encoded_datasource_from_url
 from webilastik.server.session_allocator import uncachable_json_response
+from webilastik.utility.log import Logger
+
+logger = Logger()
+
+def _parse_image_format(requested_format: str) -> 'Literal["png", "jpeg"] | None':
+    if requested_format == "png":
+        return "png"
+    if requested_format in ("jpeg", "jpg"):
+        return "jpeg"
+    return None
+
+@dataclass(frozen=True)
+class _EncodedTile:
+    body: "bytes | memoryview"
+    content_type: str
+    etag: str
+
+class _EncodedTileCache:
+    """An LRU of encoded prediction tiles, so that the same tile requested again (e.g. when panning back and
+    forth in neuroglancer) doesn't have to be predicted and encoded again"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._tiles: "OrderedDict[Hashable, _EncodedTile]" = OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+        super().__init__()
+
+    def get(self, key: Hashable) -> "_EncodedTile | None":
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put(self, key: Hashable, tile: _EncodedTile):
+        num_bytes = memoryview(tile.body).nbytes
+        if num_bytes > self.max_bytes:
+            return
+        with self._lock:
+            old_tile = self._tiles.pop(key, None)
+            if old_tile is not None:
+                self._num_bytes -= memoryview(old_tile.body).nbytes
+            self._tiles[key] = tile
+            self._num_bytes += num_bytes
+            while self._num_bytes > self.max_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self._num_bytes -= memoryview(evicted.body).nbytes
+
+_encoded_tiles = _EncodedTileCache(max_bytes=256 * 1024 * 1024)
+_tiles_in_flight: "Dict[Hashable, asyncio.Future[_EncodedTile]]" = {}
+_prefetches_in_flight: "Set[asyncio.Future[_EncodedTile]]" = set()
+_MAX_PREFETCHES_IN_FLIGHT = 8
+_info_jsons: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+_MAX_CACHED_INFO_JSONS = 64
+
+def _make_tile_key(
+    *,
+    classifier: PixelClassifier[Any],
+    encoded_datasource: str,
+    roi: DataRoi,
+    image_format: 'Literal["png", "jpeg"] | None',
+    class_colors: Sequence[Color],
+) -> Tuple[Hashable, str]:
+    """The key to a tile in _encoded_tiles and the ETag for it.
+
+    The classifier instance and the roi fully determine the tile, so clients can revalidate instead of refetching"""
+    tile_key: Hashable = (
+        classifier.instance_id,
+        encoded_datasource,
+        (roi.x, roi.y, roi.z),
+        image_format,
+        tuple(color.hex_code for color in class_colors) if image_format else (),
+    )
+    etag = '"' + hashlib.sha1(repr(tile_key).encode("utf8")).hexdigest() + '"'
+    return tile_key, etag
+
+def _encode_tile(
+    predictions: Predictions,
+    *,
+    image_format: 'Literal["png", "jpeg"] | None',
+    class_colors: Sequence[Color],
+    etag: str,
+) -> _EncodedTile:
+    if image_format is not None:
+        prediction_image_bytes = next(predictions.to_z_slice_images(class_colors, image_format=image_format)) #FIXME assumes shape.t=1 and shape.z=1
+        return _EncodedTile(
+            body=prediction_image_bytes.getbuffer(), content_type=f"image/{image_format}", etag=etag
+        )
+
+    # https://github.com/google/neuroglancer/tree/master/src/neuroglancer/datasource/precomputed#raw-chunk-encoding
+    # "(...) data for the chunk is stored directly in little-endian binary format in [x, y, z, channel] Fortran order"
+    # asfortranarray and ravel only copy if the uint8 data isn't laid out like that already
+    raw_xyzc = np.asfortranarray(predictions.as_uint8().raw("xyzc"))
+    return _EncodedTile(
+        body=memoryview(raw_xyzc.ravel(order="F")), content_type="application/octet-stream", etag=etag
+    )
+
+def _get_neighbor_rois(roi: DataRoi) -> Iterator[DataRoi]:
+    """The tiles of roi.datasource that share a face with roi, assuming roi is itself one of its tiles"""
+    tile_shape = roi.datasource.tile_shape.to_dict()
+    datasource_interval = roi.datasource.interval.to_dict()
+    for axis, (start, _) in roi.to_dict().items():
+        if axis not in ("x", "y", "z"):
+            continue
+        datasource_start, datasource_stop = datasource_interval[axis]
+        for neighbor_start in (start - tile_shape[axis], start + tile_shape[axis]):
+            if datasource_start <= neighbor_start < datasource_stop:
+                neighbor_stop = min(neighbor_start + tile_shape[axis], datasource_stop)
+                yield roi.updated(**{axis: (neighbor_start, neighbor_stop)})
 
 class WsPixelClassificationApplet(WsApplet, PixelClassificationApplet):
     def _get_json_state(self) -> JsonValue:
@@ -70,14 +189,17 @@ class WsPixelClassificationApplet(WsApplet, PixelClassificationApplet):
             status=200,
         )
 
-    async def predictions_precomputed_chunks_info(self, request: web.Request) -> web.Response:
-        classifier = self._state.classifier
-        if not isinstance(classifier, PixelClassifier) :
-            return web.json_response({"error": "Classifier is not ready yet"}, status=412)
+    def _get_info_json(self, classifier: PixelClassifier[Any], request: web.Request) -> "bytes | Exception":
+        # neuroglancer asks for the info again on every reconnect, and it only depends on the classifier and datasource
+        info_key = (classifier.instance_id, request.match_info.get("encoded_raw_data", ""))
+        info_json = _info_jsons.get(info_key)
+        if info_json is not None:
+            _info_jsons.move_to_end(info_key)
+            return info_json
 
         ds_result = get_encoded_datasource_from_url(match_info_key="encoded_raw_data", request=request)
         if isinstance(ds_result, Exception):
-            return uncachable_json_response(payload=f"Could not get data source from URL: {ds_result}", status=400)
+            return ds_result
 
         info = PrecomputedChunksInfo(
             type_="image",
@@ -96,8 +218,54 @@ class WsPixelClassificationApplet(WsApplet, PixelClassificationApplet):
                 )
             ])
         )
+        info_json = json.dumps(info.to_json_value()).encode("utf8")
+        _info_jsons[info_key] = info_json
+        while len(_info_jsons) > _MAX_CACHED_INFO_JSONS:
+            _ = _info_jsons.popitem(last=False)
+        return info_json
 
-        return uncachable_json_response(info.to_json_value(), status=200)
+    async def predictions_precomputed_chunks_info(self, request: web.Request) -> web.Response:
+        classifier = self._state.classifier
+        if not isinstance(classifier, PixelClassifier) :
+            return web.json_response({"error": "Classifier is not ready yet"}, status=412)
+
+        info_json = self._get_info_json(classifier, request)
+        if isinstance(info_json, Exception):
+            return uncachable_json_response(payload=f"Could not get data source from URL: {info_json}", status=400)
+
+        return web.Response(
+            body=info_json,
+            content_type="application/json",
+            headers={
+                "Cache-Control": "no-store, must-revalidate",
+                "Expires": "0",
+            },
+        )
+
+    async def _compute_encoded_tile(
+        self,
+        *,
+        classifier: PixelClassifier[Any],
+        roi: DataRoi,
+        image_format: 'Literal["png", "jpeg"] | None',
+        class_colors: Sequence[Color],
+        etag: str,
+    ) -> _EncodedTile:
+        # only ship the classifier to executor workers that don't have it yet
+        predictions = await asyncio.wrap_future(self.executor.submit(
+            predict_with_cached_classifier, classifier.instance_id, roi
+        ))
+        if isinstance(predictions, ClassifierNotCached):
+            predictions = await asyncio.wrap_future(self.executor.submit(
+                predict_with_cached_classifier, classifier.instance_id, roi, classifier
+            ))
+        if isinstance(predictions, ClassifierNotCached):
+            raise RuntimeError("Classifier was not cached even though it was passed in")
+
+        # encoding (png compression in particular) would otherwise block the event loop and every other request
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(_encode_tile, predictions, image_format=image_format, class_colors=class_colors, etag=etag)
+        )
 
     async def precomputed_chunks_compute(self, request: web.Request) -> web.Response:
         generation = int(request.match_info.get("generation")) # type: ignore
@@ -122,36 +290,118 @@ class WsPixelClassificationApplet(WsApplet, PixelClassificationApplet):
         if generation != self._state.generation:
             return web.json_response({"error": "This classifier is stale"}, status=410)
 
-        predictions = await asyncio.wrap_future(self.executor.submit(
-            classifier,
-            DataRoi(datasource, x=(xBegin, xEnd), y=(yBegin, yEnd), z=(zBegin, zEnd))
-        ))
-
+        roi = DataRoi(datasource, x=(xBegin, xEnd), y=(yBegin, yEnd), z=(zBegin, zEnd))
+        class_colors = tuple(label_classes.keys())
+        image_format: 'Literal["png", "jpeg"] | None' = None
         if "format" in request.query:
             requested_format = request.query["format"]
-            if requested_format != "png":
-                return web.Response(status=400, text=f"Server-side rendering only available in png, not in {requested_format}")
-            if predictions.shape.z > 1:
+            image_format = _parse_image_format(requested_format)
+            if image_format is None:
+                return web.Response(status=400, text=f"Server-side rendering only available in png or jpeg, not in {requested_format}")
+            if roi.shape.z > 1:
                 return web.Response(status=400, text="Server-side rendering only available for 2d images")
 
-            class_colors = tuple(label_classes.keys())
-            prediction_png_bytes = list(predictions.to_z_slice_pngs(class_colors))[0] #FIXME assumes shape.t=1 and shape.z=1
-            return web.Response(
-                body=prediction_png_bytes.getbuffer(),
-                headers={
-                    "Cache-Control": "no-store, must-revalidate",
-                    "Expires": "0",
-                },
-                content_type="image/png",
+        encoded_datasource = request.match_info["encoded_raw_data"]
+        _, etag = _make_tile_key(
+            classifier=classifier,
+            encoded_datasource=encoded_datasource,
+            roi=roi,
+            image_format=image_format,
+            class_colors=class_colors,
+        )
+        cache_headers = {"Cache-Control": "no-cache", "ETag": etag}
+
+        if etag in (tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")):
+            return web.Response(status=304, headers=cache_headers)
+
+        tile = await self._get_encoded_tile(
+            classifier=classifier,
+            encoded_datasource=encoded_datasource,
+            roi=roi,
+            image_format=image_format,
+            class_colors=class_colors,
+        )
+        # neighboring tiles are likely to be requested next, so compute them while the client renders this one
+        for neighbor_roi in _get_neighbor_rois(roi):
+            if len(_prefetches_in_flight) >= _MAX_PREFETCHES_IN_FLIGHT:
+                break # don't let speculative work crowd out tiles that were actually requested
+            if image_format is not None and neighbor_roi.shape.z > 1:
+                continue
+            self._prefetch_encoded_tile(
+                classifier=classifier,
+                encoded_datasource=encoded_datasource,
+                roi=neighbor_roi,
+                image_format=image_format,
+                class_colors=class_colors,
             )
 
-        # https://github.com/google/neuroglancer/tree/master/src/neuroglancer/datasource/precomputed#raw-chunk-encoding
-        # "(...) data for the chunk is stored directly in little-endian binary format in [x, y, z, channel] Fortran order"
-        resp = predictions.as_uint8().raw("xyzc").tobytes("F")
-        return web.Response(
-            body=resp,
-            content_type="application/octet-stream",
+        return web.Response(body=tile.body, headers=cache_headers, content_type=tile.content_type)
+
+    async def _get_encoded_tile(
+        self,
+        *,
+        classifier: PixelClassifier[Any],
+        encoded_datasource: str,
+        roi: DataRoi,
+        image_format: 'Literal["png", "jpeg"] | None',
+        class_colors: Sequence[Color],
+    ) -> _EncodedTile:
+        tile_key, etag = _make_tile_key(
+            classifier=classifier,
+            encoded_datasource=encoded_datasource,
+            roi=roi,
+            image_format=image_format,
+            class_colors=class_colors,
         )
+        tile = _encoded_tiles.get(tile_key)
+        if tile is not None:
+            return tile
+        tile_task = _tiles_in_flight.get(tile_key)
+        if tile_task is None:
+            tile_task = asyncio.ensure_future(self._compute_encoded_tile(
+                classifier=classifier, roi=roi, image_format=image_format, class_colors=class_colors, etag=etag
+            ))
+            _tiles_in_flight[tile_key] = tile_task
+            def on_tile_done(task: "asyncio.Future[_EncodedTile]"):
+                del _tiles_in_flight[tile_key]
+                if not task.cancelled() and task.exception() is None:
+                    _encoded_tiles.put(tile_key, task.result())
+            tile_task.add_done_callback(on_tile_done)
+        # shielded so that a client hanging up doesn't cancel the computation for other waiters
+        return await asyncio.shield(tile_task)
+
+    def _prefetch_encoded_tile(
+        self,
+        *,
+        classifier: PixelClassifier[Any],
+        encoded_datasource: str,
+        roi: DataRoi,
+        image_format: 'Literal["png", "jpeg"] | None',
+        class_colors: Sequence[Color],
+    ):
+        tile_key, _ = _make_tile_key(
+            classifier=classifier,
+            encoded_datasource=encoded_datasource,
+            roi=roi,
+            image_format=image_format,
+            class_colors=class_colors,
+        )
+        if tile_key in _tiles_in_flight or _encoded_tiles.get(tile_key) is not None:
+            return
+        prefetch_task = asyncio.ensure_future(self._get_encoded_tile(
+            classifier=classifier,
+            encoded_datasource=encoded_datasource,
+            roi=roi,
+            image_format=image_format,
+            class_colors=class_colors,
+        ))
+        _prefetches_in_flight.add(prefetch_task)
+        def on_prefetch_done(task: "asyncio.Future[_EncodedTile]"):
+            _prefetches_in_flight.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.debug("Prefetching tile %s failed: %s", roi, task.exception())
+        prefetch_task.add_done_callback(on_prefetch_done)
+
 
     async def predictions_precomputed_chunks_info_head(self, request: web.Request) -> web.Response:
         """HEAD handler for precomputed chunks info - returns same headers as GET but without body"""
@@ -159,33 +409,10 @@ class WsPixelClassificationApplet(WsApplet, PixelClassificationApplet):
         if not isinstance(classifier, PixelClassifier):
             return web.Response(status=412, headers={"Content-Type": "application/json"})
 
-        ds_result = get_encoded_datasource_from_url(match_info_key="encoded_raw_data", request=request)
-        if isinstance(ds_result, Exception):
+        content = self._get_info_json(classifier, request)
+        if isinstance(content, Exception):
             return web.Response(status=400, headers={"Content-Type": "application/json"})
 
-        # Calculate the expected response size (approximate JSON size)
-        info = PrecomputedChunksInfo(
-            type_="image",
-            data_type=np.dtype("uint8"),
-            num_channels=classifier.num_classes,
-            scales=tuple([
-                PrecomputedChunksScale(
-                    chunk_sizes=tuple([
-                        (ds_result.tile_shape.x, ds_result.tile_shape.y, ds_result.tile_shape.z)
-                    ]),
-                    encoding=RawEncoder(),
-                    key=PurePosixPath("data"),
-                    resolution=ds_result.spatial_resolution,
-                    size=(ds_result.shape.x, ds_result.shape.y, ds_result.shape.z),
-                    voxel_offset=(ds_result.interval.start.x, ds_result.interval.start.y, ds_result.interval.start.z),
-                )
-            ])
-        )
-        
-        # Serialize to get content length
-        import json
-        content = json.dumps(info.to_json_value()).encode('utf-8')
-        
         return web.Response(
             status=200,
             headers={
@@ -225,21 +452,21 @@ class WsPixelClassificationApplet(WsApplet, PixelClassificationApplet):
         num_channels = classifier.num_classes
 
         if "format" in request.query:
-            requested_format = request.query["format"]
-            if requested_format != "png":
+            image_format = _parse_image_format(request.query["format"])
+            if image_format is None:
                 return web.Response(status=400, headers={"Content-Type": "text/plain"})
             if depth > 1:
                 return web.Response(status=400, headers={"Content-Type": "text/plain"})
             
-            # PNG size is variable, but we can provide a reasonable estimate
+            # Image size is variable, but we can provide a reasonable estimate
             # For prediction images, this is typically much smaller than raw data
-            estimated_png_size = width * height * 3  # Rough estimate for RGB PNG
+            estimated_image_size = width * height * 3  # Rough estimate for RGB image
             
             return web.Response(
                 status=200,
                 headers={
-                    "Content-Type": "image/png",
-                    "Content-Length": str(estimated_png_size),
+                    "Content-Type": f"image/{image_format}",
+                    "Content-Length": str(estimated_image_size),
                     "Cache-Control": "no-store, must-revalidate",
                     "Expires": "0",
                 }
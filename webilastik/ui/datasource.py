@@ -1,9 +1,11 @@
 # pyright: strict
 
+from collections import OrderedDict
 from collections.abc import Mapping
 from typing import Optional, Tuple
 from base64 import b64decode
 import json
+import threading
 
 from aiohttp import web
 
@@ -21,16 +23,33 @@ from webilastik.utility.url import Url
 def _ensure_none(value: None):
     pass
 
+_decoded_datasources: "OrderedDict[str, FsDataSource]" = OrderedDict()
+_decoded_datasources_lock = threading.Lock()
+_MAX_DECODED_DATASOURCES = 128
+
 def get_encoded_datasource_from_url(match_info_key: str, request: web.Request) -> "FsDataSource | Exception":
     encoded_datasource = request.match_info.get(match_info_key)
     if not encoded_datasource:
         return Exception("Missing path segment: datasource=...")
+    # every tile request carries the same encoded datasource, so don't rebuild it (and its filesystem) every time
+    with _decoded_datasources_lock:
+        cached_datasource = _decoded_datasources.get(encoded_datasource)
+        if cached_datasource is not None:
+            _decoded_datasources.move_to_end(encoded_datasource)
+            return cached_datasource
     decoded_datasource = b64decode(encoded_datasource, altchars=b'-_').decode('utf8')
     datasource_json_value = json.loads(decoded_datasource)
     datasource_dto = parse_as_Union_of_PrecomputedChunksDataSourceDto0N5DataSourceDto0SkimageDataSourceDto0DziLevelDataSourceDto_endof_(datasource_json_value)
     if isinstance(datasource_dto, Exception):
         return datasource_dto
-    return FsDataSource.try_from_message(datasource_dto)
+    datasource_result = FsDataSource.try_from_message(datasource_dto)
+    if isinstance(datasource_result, Exception):
+        return datasource_result
+    with _decoded_datasources_lock:
+        _decoded_datasources[encoded_datasource] = datasource_result
+        while len(_decoded_datasources) > _MAX_DECODED_DATASOURCES:
+            _ = _decoded_datasources.popitem(last=False)
+    return datasource_result
 
 def try_get_datasources_from_url(
     *,
@@ -1,5 +1,6 @@
 # pyright: strict
 
+import os
 import sys
 
 class Logger:
@@ -8,8 +9,15 @@ class Logger:
     warn_escape =  "\033[33m" if sys.stderr.isatty()  else ""
     error_escape = "\033[31m" if sys.stderr.isatty()  else ""
     end_escape =   "\033[0m"  if sys.stderr.isatty()  else ""
+    debug_enabled = os.environ.get("WEBILASTIK_DEBUG_LOGS", "true").lower() not in ("0", "false", "no")
 
-    def debug(self, message: str):
+    def debug(self, message: str, *args: object):
+        """message is %-formatted with args only if debug logs are enabled, so callers on hot paths can skip
+        building their messages altogether"""
+        if not self.debug_enabled:
+            return
+        if args:
+            message = message % args
         print(f"{self.debug_escape}[DEBUG]{message}{self.end_escape}", file=sys.stderr)
 
     def info(self, message: str):
@@ -1,11 +1,13 @@
 # pyright: strict
 
 from io import IOBase
-from typing import Literal, Mapping, Tuple
+from typing import List, Literal, Mapping, Tuple
 import requests
 import sys
 
+from requests.adapters import HTTPAdapter
 from requests.models import CaseInsensitiveDict
+from urllib3.util.retry import Retry
 
 from webilastik.utility.url import Url
 
@@ -38,6 +40,41 @@ class ErrRequestCrashed(Exception):
 class ErrBadContentLength(Exception):
     pass
 
+def make_session() -> requests.Session:
+    """A session meant to be shared by all threads of a process, so that connections (and their TLS handshakes)
+    get reused across requests to the same hosts"""
+    # Tiles are read concurrently by many threads; the default pool keeps only 10 connections per host, so every
+    # request beyond that would open (and then throw away) a fresh TLS connection
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=128,
+        pool_block=False,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def range_header_value(offset: int, num_bytes: "int | None") -> str:
+    if offset < 0:
+        return f"bytes={offset}"
+    if num_bytes is None:
+        return f"bytes={offset}-"
+    return f"bytes={offset}-{max(offset, offset + num_bytes - 1)}"
+
+def range_headers(offset: int, num_bytes: "int | None") -> Mapping[str, str]:
+    # a Range of "bytes=0-" is the same as no Range at all, and some S3-compatible stores reject it (e.g. on PUT)
+    if offset == 0 and num_bytes is None:
+        return {}
+    return {"Range": range_header_value(offset=offset, num_bytes=num_bytes)}
+
 def request(
     session: requests.Session,
     method: Literal["get", "put", "post", "delete"],
@@ -47,31 +84,35 @@ def request(
     num_bytes: "int | None" = None,
     headers: "Mapping[str, str] | None" = None,
 ) -> "Tuple[bytes, CaseInsensitiveDict[str]] | ErrRequestCompletedAsFailure | ErrRequestCrashed":
-    range_header_value: str
-    if offset >= 0:
-        range_header_value = f"bytes={offset}-"
-        if num_bytes is not None:
-            range_end = max(offset, offset + num_bytes - 1)
-            range_header_value += str(range_end)
-    else:
-        range_header_value = f"bytes={offset}"
-
-    headers = {**(headers or {}), "Range": range_header_value}
+    headers = {**(headers or {}), **range_headers(offset=offset, num_bytes=num_bytes)}
 
     try:
-        response = session.request(method=method, url=url.schemeless_raw, data=data, headers=headers)
-        if not response.ok:
-            return ErrRequestCompletedAsFailure(
-                status_code=response.status_code,
-                response_text=response.text[:1000],  # Limit to first 1000 chars
-                url=url.schemeless_raw,
-                headers=response.headers,
-                request_headers=headers,
-            )
-        content = response.content
-        if num_bytes is not None:
-            content = content[:num_bytes]
-        return (content, response.headers)
+        with session.request(method=method, url=url.schemeless_raw, data=data, headers=headers, stream=True) as response:
+            if not response.ok:
+                return ErrRequestCompletedAsFailure(
+                    status_code=response.status_code,
+                    response_text=response.text[:1000],  # Limit to first 1000 chars
+                    url=url.schemeless_raw,
+                    headers=response.headers,
+                    request_headers=headers,
+                )
+            if num_bytes is None:
+                return (response.content, response.headers)
+            if response.status_code == 206:
+                return (response.content[:num_bytes], response.headers)
+            # the server ignored the Range header and is sending the whole thing, so stop reading once enough bytes
+            # have arrived. Chunks are counted after decoding, since a compressed body can decode to more (or, mid
+            # stream, fewer) bytes than were read. Stopping early means the connection can't be reused, which is why
+            # ranged (206) responses are read in full above
+            chunks: List[bytes] = []
+            num_read = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                chunk_bytes: bytes = chunk
+                chunks.append(chunk_bytes)
+                num_read += len(chunk_bytes)
+                if num_read >= num_bytes:
+                    break
+            return (b"".join(chunks)[:num_bytes], response.headers)
     except Exception as e:
         print(f"HTTP ERROR: {e}", file=sys.stderr)
         return ErrRequestCrashed(e)